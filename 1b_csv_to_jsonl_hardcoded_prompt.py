@@ -1,20 +1,35 @@
-import csv
-import json
 import os
 import tiktoken
 
+import calibration
+import instrumentation
+import manifest
+import sharder
+from results_store import ResultsStore
+from schema import JSON_SCHEMA
+from token_cache import TokenCache
+
 OUTPUT_DIR = os.path.dirname(os.path.abspath(__file__))
 INPUT_CSV =  os.path.join(OUTPUT_DIR, "Input.csv")
+DEDUP_MAP_CSV = os.path.join(OUTPUT_DIR, "hear_about_dedup_map.csv")  # read by 4_get_batch.py
+FAST_PATH_CSV = os.path.join(OUTPUT_DIR, "hear_about_fast_path.csv")  # read by 4_get_batch.py
 
 BASE_MODEL = "gpt-4o"  # token estimator
 MODEL = "gpt-5"
 MAX_TOKENS_PER_BATCH = 1500000 #from https://platform.openai.com/settings/organization/limits
 MAX_LINES_PER_BATCH = 50000
+MAX_BYTES_PER_BATCH = 200 * 1024 * 1024  # batch input file size limit, checked by the upload in 2_create_batch.py
+OPEN_SHARDS = 1  # >1 packs rows first-fit across that many open shards for fewer, fuller shards
+ESTIMATE_WORKERS = os.cpu_count() or 1  # threads used by the batched token estimator
 
 # === Calibrated from your sample API usage ===
 MAX_TOKENS = 100
 PROMPT_TOKENS = 1940            # measured once from a real call
 OVERHEAD_TOKENS = 145        # measured once from a real call
+# Fallback only: calibration.py fits the real overhead from batch outputs into calibration.json
+
+TOKEN_SAFETY_MARGIN = 0.02  # pack shards to 98% of MAX_TOKENS_PER_BATCH
+PROMPT_CACHE_KEY = None  # e.g. "hear_about"; routes every request to the same prompt cache
 
 PROMPT = """You are a digital marketing source classifier. Given a single free‑text answer to “How did you hear about Telnyx?”, output a JSON object with:
 
@@ -144,121 +159,121 @@ Input: "newspaper"
 Output: {"hear_source":"Unknown","hear_source_detail":""}
 """
 
-JSON_SCHEMA = {
-        "type": "object",
-        "additionalProperties": False,
-        "required": [
-            "hear_source",
-            "hear_source_detail"
-        ],
-        "properties": {
-            "hear_source": {
-                "type": "string",
-                "enum": [
-                    "Inbound",
-                    "Organic - Search",
-                    "Organic - Social",
-                    "Organic - AI",
-                    "Paid - Search",
-                    "Paid - Social",
-                    "Paid - Display",
-                    "Referral - General",
-                    "Referral - WOM",
-                    "Sales",
-                    "Tradeshow",
-                    "Unknown"
-                ],
-                "description": "Top-level classification of how the user heard about Telnyx."
-            },
-            "hear_source_detail": {
-                "type": "string",
-                "description": "Specific medium/channel (e.g., 'Google', 'Reddit', 'YouTube', 'Comparison', 'Specific Person Mentioned'). Use empty string if unknown."
-            }
-        }
-    }
-    
+# Everything except the input is built once and shared by every request, so the
+# instructions + schema prefix (~1940 tokens) is byte-identical and served from the
+# prompt cache at the discounted cached-input rate. Never put row data in it.
+REQUEST_BODY = {
+    "model": MODEL,
+    "instructions": PROMPT,
+    "input": "",
+    "max_output_tokens": MAX_TOKENS,
+    "text": {"format": {
+        "type": "json_schema",
+        "name": "telnyx_hear_source_extraction_v1",
+        "strict": True,
+        "schema": JSON_SCHEMA,
+    }},
+}
+if PROMPT_CACHE_KEY:
+    REQUEST_BODY["prompt_cache_key"] = PROMPT_CACHE_KEY
+
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 
 enc = tiktoken.encoding_for_model(BASE_MODEL)
+token_cache = TokenCache(enc)
 
 
-def estimate_tokens(text: str) -> int:
-    if text is None:
-        return 0
-    return len(enc.encode(str(text)))
-
-def estimate_request_tokens(json_entry: dict) -> int:
-
-    body = json_entry.get("body", {})
-    t_input = estimate_tokens(body.get("input", ""))
-
-    tokens = t_input + OVERHEAD_TOKENS + PROMPT_TOKENS + MAX_TOKENS
+def estimate_tokens_batch(texts, workers=ESTIMATE_WORKERS):
+    # Cached counts are reused; unseen texts go through encode_batch across `workers` threads
+    return token_cache.count_batch(texts, workers)
 
-    return tokens
+def estimate_request_tokens_batch(json_entries, workers=ESTIMATE_WORKERS, input_overhead=None):
+    if input_overhead is None:
+        input_overhead = input_overhead_tokens()
+    inputs = [json_entry.get("body", {}).get("input", "") for json_entry in json_entries]
+    return [
+        t_input + input_overhead + MAX_TOKENS
+        for t_input in estimate_tokens_batch(inputs, workers)
+    ]
 
 def create_json_entry(row):
     return {
         "custom_id": row["id"],
         "method": "POST",
         "url": "/v1/responses",
-        "body": {
-            "model": MODEL,
-            "instructions": PROMPT,
-            "input": row["how_hear"],
-            "max_output_tokens": MAX_TOKENS,
-            "text":{"format": {
-            "type": "json_schema",
-            "name": "telnyx_hear_source_extraction_v1",
-            "strict": True,
-            "schema": JSON_SCHEMA,
-        }}
-        }
+        "body": dict(REQUEST_BODY, input=row["how_hear"]),
     }
 
-def write_batch(batch, index):
-    output_path = os.path.join(OUTPUT_DIR, f"hear_about_batch_hardcoded_prompt_{index}.jsonl")
-    with open(output_path, 'w', encoding='utf-8') as outfile:
-        for item in batch:
-            outfile.write(json.dumps(item, ensure_ascii=False) + '\n')
-
-def process_csv(input_csv, start_row=0, end_row=None):
-    with open(input_csv, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        all_rows = list(reader)
-        selected_rows = all_rows[start_row:end_row]
-
-        batch = []
-        batch_token_count = 0
-        batch_index = 0
-
-        for row in selected_rows:
-            json_entry = create_json_entry(row)
-
-            # Predict tokens if we were to add this as the *next* item in the batch
-            req_tokens = estimate_request_tokens(json_entry)
-
-            # If adding this item would exceed token/line limits, flush the current batch first
-            if batch and (
-                batch_token_count + req_tokens > MAX_TOKENS_PER_BATCH
-                or len(batch) >= MAX_LINES_PER_BATCH
-            ):
-                write_batch(batch, batch_index)
-                batch_index += 1
-                batch = []
-                batch_token_count = 0
-
-            # Edge case: single request larger than budget; write it alone to avoid blocking
-            if not batch and req_tokens > MAX_TOKENS_PER_BATCH:
-                write_batch([json_entry], batch_index)
-                batch_index += 1
-                continue
-
-            batch.append(json_entry)
-            batch_token_count += req_tokens
-
-        if batch:
-            write_batch(batch, batch_index)
+def prompt_version():
+    # Model + prompt fingerprint; changes whenever the request would be answered differently
+    return calibration.variant_key(create_json_entry({"id": "", "how_hear": ""}))
+
+def input_overhead_tokens():
+    fitted = calibration.load_input_overhead(prompt_version())
+    return fitted if fitted is not None else OVERHEAD_TOKENS + PROMPT_TOKENS
+
+def batch_path(index, output_dir=OUTPUT_DIR):
+    return os.path.join(output_dir, f"hear_about_batch_hardcoded_prompt_{index}.jsonl")
+
+def process_csv(input_csv, start_row=0, end_row=None, workers=ESTIMATE_WORKERS, dedup=False,
+                fast_path=False, incremental=False, open_shards=OPEN_SHARDS, output_dir=OUTPUT_DIR,
+                manifest_path=manifest.MANIFEST_JSON, job=None):
+    # With incremental, rows already in results_store.sqlite with the same answer and prompt are skipped
+    # With fast_path, obvious answers are classified locally by rules.py and never reach the batch
+    # With dedup, one request is sent per unique normalized answer and 4_get_batch.py fans results back out
+    # With open_shards > 1, rows are packed across several shards at once to minimize the shard count
+    # output_dir and manifest_path let pipeline.py keep every job in its own directory
+    input_overhead = input_overhead_tokens()
+    print(f"Estimating {input_overhead} overhead tokens per request")
+    dedup_map_path = os.path.join(output_dir, os.path.basename(DEDUP_MAP_CSV)) if dedup else None
+    fast_path_path = os.path.join(output_dir, os.path.basename(FAST_PATH_CSV)) if fast_path else None
+
+    # Rows are streamed and each shard is written incrementally, so the CSV is never held in memory
+    stats = sharder.new_stats()
+    rows_written, shards = sharder.shard_csv(
+        input_csv,
+        create_json_entry,
+        lambda json_entries: estimate_request_tokens_batch(json_entries, workers, input_overhead),
+        lambda index: batch_path(index, output_dir),
+        int(MAX_TOKENS_PER_BATCH * (1 - TOKEN_SAFETY_MARGIN)),
+        MAX_LINES_PER_BATCH,
+        start_row=start_row,
+        end_row=end_row,
+        dedup_map_path=dedup_map_path,
+        fast_path_path=fast_path_path,
+        results_store=ResultsStore() if incremental else None,
+        prompt_version=prompt_version(),
+        max_bytes_per_batch=MAX_BYTES_PER_BATCH,
+        open_shards=open_shards,
+        stats=stats,
+    )
+    token_cache.print_stats()
+
+    # Record every shard in the job manifest consumed by 2_create_batch.py
+    job_manifest = manifest.new_manifest(
+        [dict(shard, model=MODEL) for shard in shards],
+        job=job,
+        prompt_version=prompt_version(),
+        incremental=incremental,
+        input_csv=os.path.abspath(input_csv),
+        dedup_map_path=dedup_map_path,
+        fast_path_path=fast_path_path,
+        # reconcile.py packs retry shards within the same limits
+        limits={
+            "max_tokens_per_batch": int(MAX_TOKENS_PER_BATCH * (1 - TOKEN_SAFETY_MARGIN)),
+            "max_lines_per_batch": MAX_LINES_PER_BATCH,
+            "max_bytes_per_batch": MAX_BYTES_PER_BATCH,
+        },
+    )
+    manifest.save(job_manifest, manifest_path)
+    print(f"Job manifest saved to: {manifest_path}")
+
+    instrumentation.emit_stages(stats["timings"], job=job_manifest["job"], model=MODEL)
+    instrumentation.emit("rows_read", stats["rows_read"], job=job_manifest["job"])
+    instrumentation.emit("requests_written", rows_written, job=job_manifest["job"])
+    instrumentation.emit("token_cache_hit_rate", round(token_cache.hit_rate(), 4), job=job_manifest["job"])
+    return rows_written, shards
 
 if __name__ == "__main__":
   process_csv(INPUT_CSV, start_row=0, end_row=3)
\ No newline at end of file
@@ -3,6 +3,8 @@ import json
 import os
 from dotenv import load_dotenv
 
+import pricing
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -12,11 +14,6 @@ client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 current_dir = os.path.dirname(os.path.abspath(__file__))
 batch_id_file = os.path.join(current_dir, "latest_batch_id.txt")
 
-#https://platform.openai.com/docs/pricing?latest-pricing=batch
-input_cost_per_million = 0.625  # $0.625 per million input tokens
-output_cost_per_million = 5.0  # $5 per million output tokens
-
-
 with open(batch_id_file, "r") as f:
     batch_id = f.read().strip()
 
@@ -36,17 +33,22 @@ if batch.status == "completed" and batch.usage:
     print(f"\nOutput file ID: {output_file_id}")
     print(f"Output file ID saved to: {output_file_id_file}")
     
-    input_tokens = batch.usage["input_tokens"]
-    output_tokens = batch.usage["output_tokens"]
-    total_tokens = batch.usage["total_tokens"]
+    usage = batch.usage.model_dump()
+    input_tokens = usage["input_tokens"]
+    cached_tokens = (usage.get("input_tokens_details") or {}).get("cached_tokens", 0)
+    output_tokens = usage["output_tokens"]
+    total_tokens = usage["total_tokens"]
     
-    # Calculate costs
-    input_cost = (input_tokens / 1_000_000) * input_cost_per_million
-    output_cost = (output_tokens / 1_000_000) * output_cost_per_million
+    # Calculate costs from pricing.py; the shared prompt prefix served from cache is billed at the cached rate
+    model = getattr(batch, "model", None)
+    input_cost = pricing.cost(input_tokens, 0, cached_tokens, model=model)
+    output_cost = pricing.cost(0, output_tokens, model=model)
     total_cost = input_cost + output_cost
+    cache_hit_rate = cached_tokens / input_tokens if input_tokens else 0.0
     
     print(f"\n=== BATCH COST SUMMARY ===")
     print(f"Input tokens: {input_tokens:,}")
+    print(f"Cached input tokens: {cached_tokens:,} ({cache_hit_rate:.1%} cache hit rate)")
     print(f"Output tokens: {output_tokens:,}")
     print(f"Total tokens: {total_tokens:,}")
     print(f"Input cost: ${input_cost:.6f}")
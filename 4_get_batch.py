@@ -1,94 +1,70 @@
-import pandas as pd
-import json
 from openai import OpenAI
-import ast
+import asyncio
 import os
 from dotenv import load_dotenv
 
+import aggregate
+import instrumentation
+import manifest
+import merge
+import results
+
+OUTPUT_FORMAT = "csv"  # or "parquet" (needs pyarrow)
+OUTPUT_COLUMNS = None  # Input.csv columns to keep, e.g. ["id", "email", "how_hear"]; None keeps all
+
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# Read output file ID from file
 current_dir = os.path.dirname(os.path.abspath(__file__))
-output_file_id_file = os.path.join(current_dir, "latest_output_file_id.txt")
-
-with open(output_file_id_file, "r") as f:
-    output_file_id = f.read().strip()
+retry_path = os.path.join(current_dir, "output_hear_about_retry.jsonl")
+decode_stats = results.new_stats()
+job_manifest = manifest.load_if_exists() or {}
 
-print(f"Using output file ID: {output_file_id}")
-output_file = client.files.content(output_file_id)
-
-# Save raw output for reference
-output_jsonl_path = os.path.join(current_dir, "output_hear_about.jsonl")
-with open(output_jsonl_path, "w") as f:
-    f.write(output_file.text)
-print(f"Raw output saved to: {output_jsonl_path}")
+if job_manifest and manifest.has_results(job_manifest):
+    # Fetch every shard of the job concurrently and decode them into one deduplicated index
+    # (shards run by realtime.py are already on disk in the same format)
+    job_manifest = asyncio.run(aggregate.download_all(manifest.MANIFEST_JSON))
+    index = aggregate.build_index(job_manifest, retry_path, decode_stats)
+    results.print_stats(decode_stats, retry_path)
+    usage_summary = aggregate.usage_summary(job_manifest, index)
+    aggregate.print_usage_summary(usage_summary, len(index))
+    aggregate.emit_usage_metrics(job_manifest["job"], usage_summary)
+else:
+    # Initialize OpenAI client
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-# Parse the response data
-lines = output_file.text.strip().split("\n")
-data = [json.loads(line) for line in lines]
+    # Read output file ID from file
+    output_file_id_file = os.path.join(current_dir, "latest_output_file_id.txt")
 
-# Process each record from OpenAI response
-records = []
-for item in data:
-    custom_id = item.get("custom_id")
-    response_body = item["response"]["body"]
-    
-    # Find the message output (skip reasoning outputs)
-    message_output = None
-    for output_item in response_body["output"]:
-        if output_item.get("type") == "message" and "content" in output_item:
-            message_output = output_item
-            break
-    
-    content = message_output["content"][0]["text"]
-    parsed = ast.literal_eval(content)
-    hear_source = parsed.get('hear_source', '')
-    hear_source_detail = parsed.get('hear_source_detail', '')
-    
-    # Extract token usage if available
-    usage = response_body.get("usage", {})
-    prompt_tokens = usage.get("input_tokens", 0)
-    completion_tokens = usage.get("output_tokens", 0)
-    total_tokens = usage.get("total_tokens", 0)
-    
-    # Calculate costs (matching poll_batch.py pricing)
-    input_cost_per_million = 0.625  # $0.625 per million input tokens
-    output_cost_per_million = 5.0  # $5 per million output tokens
-    cost_prompt = (prompt_tokens / 1_000_000) * input_cost_per_million
-    cost_completion = (completion_tokens / 1_000_000) * output_cost_per_million
-    total_cost = cost_prompt + cost_completion
+    with open(output_file_id_file, "r") as f:
+        output_file_id = f.read().strip()
 
-    records.append({
-        "custom_id": custom_id,
-        "hear_source": hear_source,
-        "hear_source_detail": hear_source_detail,
-        "prompt_tokens": prompt_tokens,
-        "completion_tokens": completion_tokens,
-        "total_tokens": total_tokens,
-        "cost_usd": round(total_cost, 6)
-    })
+    print(f"Using output file ID: {output_file_id}")
 
-# Create DataFrame from OpenAI results
-df_new = pd.DataFrame(records)
+    # Stream the raw output to disk in chunks and keep it for reference
+    output_jsonl_path = os.path.join(current_dir, "output_hear_about.jsonl")
+    results.download_to_file(client, output_file_id, output_jsonl_path)
+    print(f"Raw output saved to: {output_jsonl_path}")
 
-# Load existing CSV
-input_path = os.path.join(current_dir,"Input.csv")
-output_path = os.path.join(current_dir,"output_hear_about.csv")
-if os.path.exists(input_path):
-    df_existing = pd.read_csv(input_path)
+    # Parse the response data one line at a time and index it by custom_id; undecodable lines go to the retry file
+    records = results.iter_records(output_jsonl_path, retry_path, decode_stats)
+    index = {record["custom_id"]: record for record in records}
+    results.print_stats(decode_stats, retry_path)
 
-    # Perform INNER JOIN: only keep rows where id is found in new data
-    df_merged = df_existing.merge(df_new, how='inner', left_on="id", right_on="custom_id")
+instrumentation.emit_stages(decode_stats["timings"], job=job_manifest.get("job"))
 
-    # Drop redundant custom_id column if desired
-    df_merged.drop(columns=["custom_id"], inplace=True)
+# Add fast-path rows, fan deduplicated results back out and stream Input.csv through the index
+merge.merge_job(
+    index,
+    os.path.join(current_dir, "Input.csv"),
+    os.path.join(current_dir, f"output_hear_about.{OUTPUT_FORMAT}"),
+    job_manifest,
+    # Only the files this job's manifest recorded, never leftovers from an earlier run
+    fast_path_path=job_manifest.get("fast_path_path"),
+    dedup_map_path=job_manifest.get("dedup_map_path"),
+    output_format=OUTPUT_FORMAT,
+    columns=OUTPUT_COLUMNS,
+)
 
-    # Save to output path
-    df_merged.to_csv(output_path, index=False)
-    print(f"Filtered and merged results saved to {output_path}")
-else:
-    print(f"File not found at {input_path}")
\ No newline at end of file
+# Stage timings, token estimates vs actuals and cost for scraping (see instrumentation.py)
+print(f"Metrics saved to: {instrumentation.write_prometheus()}")
@@ -1,30 +1,27 @@
-from openai import OpenAI
-import os
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+"""Cancel batches in parallel: the given ids, every unfinished batch matching the filters, or the latest batch.
 
-# Read batch ID from file
-current_dir = os.path.dirname(os.path.abspath(__file__))
-batch_id_file = os.path.join(current_dir, "latest_batch_id.txt")
-
-with open(batch_id_file, "r") as f:
-    batch_id = f.read().strip()
+    python 98_cancel_batch.py --job job_1760000000
+    python 98_cancel_batch.py batch_abc batch_def
+"""
+import argparse
+import asyncio
+import os
 
-print(f"Cancelling batch: {batch_id}")
+import batches
 
-# Cancel the batch
-cancelled_batch = client.batches.cancel(batch_id)
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("batch_ids", nargs="*")
+batches.add_filter_arguments(parser)
+args = parser.parse_args()
 
-print(f"Batch cancellation status: {cancelled_batch.status}")
-print(f"Cancelling at: {cancelled_batch.cancelling_at}")
+if not (args.batch_ids or args.status or args.metadata or args.job):
+    # Without ids or filters, cancel the batch created by 2_create_batch.py
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(current_dir, "latest_batch_id.txt"), "r") as f:
+        args.batch_ids = [f.read().strip()]
 
-if cancelled_batch.cancelled_at:
-    print(f"Cancelled at: {cancelled_batch.cancelled_at}")
-    print("✅ Batch successfully cancelled!")
-else:
-    print("⏳ Batch cancellation is in progress...")
+statuses = asyncio.run(batches.cancel_selected(args))
+failed = sum(1 for status in statuses.values() if status is None)
+print(f"Cancelled {len(statuses) - failed} batch(es), {failed} failed")
+if any(status == "cancelling" for status in statuses.values()):
+    print("⏳ Cancellation is in progress; batches stay in cancelling for up to 10 minutes")
@@ -1,12 +1,24 @@
-from openai import OpenAI
-import os, json
-from dotenv import load_dotenv
+"""List every batch in the account, across all pages, with optional filters.
 
-# Load environment variables from .env file
-load_dotenv()
+Uses batches.py, so finished batches come from batch_cache.json instead of
+being fetched again.
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    python 99_list_batches.py --status in_progress --job job_1760000000
+"""
+import argparse
+import asyncio
+import json
 
-batches = client.batches.list(limit=10)
-print(json.dumps(batches.model_dump(), indent=2))
+import batches
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+batches.add_filter_arguments(parser)
+parser.add_argument("--json", action="store_true", help="print the batches as JSON")
+args = parser.parse_args()
+
+selected, stats = asyncio.run(batches.list_selected(args))
+if args.json:
+    print(json.dumps(selected, indent=2))
+else:
+    batches.print_batches(selected)
+    batches.print_stats(stats)
@@ -0,0 +1,158 @@
+"""Aggregate every shard of a job into one result set and one cost summary.
+
+A job split into many shards used to need one 4_get_batch.py run per
+shard, each overwriting the output. Here every shard's output and error
+files are fetched concurrently (retrieving batch status first when the
+poller has not already done so), all outputs are decoded into a single
+index deduplicated by custom_id, and billed usage is summed across
+batches.
+"""
+import asyncio
+import json
+
+import instrumentation
+import manifest
+import poller
+import pricing
+import results
+import submitter
+
+DOWNLOAD_CONCURRENCY = 8
+
+
+async def download_all(manifest_path=manifest.MANIFEST_JSON, client=None, concurrency=DOWNLOAD_CONCURRENCY):
+    """Fetch outputs of every finished shard not downloaded yet; returns the updated manifest."""
+    client = client or submitter.make_async_client()
+    job_manifest = manifest.load(manifest_path)
+    base = manifest.snapshot(job_manifest)
+    shards = [shard for shard in job_manifest["shards"] if shard.get("batch_id") and not shard.get("downloaded")]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(shard):
+        async with semaphore:
+            await poller.poll_shard(client, shard, job_manifest["job"])
+
+    await asyncio.gather(*(fetch(shard) for shard in shards))
+    job_manifest = manifest.save_changes(job_manifest, base, manifest_path)
+
+    unfinished = [shard["index"] for shard in job_manifest["shards"] if not shard.get("downloaded")]
+    if unfinished:
+        print(f"Shards {unfinished} have no results yet; merging the finished ones")
+    return job_manifest
+
+
+def build_index(job_manifest, retry_path=None, stats=None):
+    """Decode every downloaded output/error file into {custom_id: record}.
+
+    The first successful record for a custom_id wins, so a row retried by
+    reconcile.py after succeeding elsewhere is not counted twice. Failures
+    that never succeeded in any shard are written to retry_path.
+    """
+    stats = stats if stats is not None else results.new_stats()
+    index = {}
+    failures = {}
+    for shard in job_manifest["shards"]:
+        for path in (shard.get("output_path"), shard.get("error_path")):
+            if not path:
+                continue
+            for custom_id, record, error in results.iter_outcomes(path, stats, pricing.shard_tier(shard)):
+                if record is not None:
+                    index.setdefault(custom_id, record)
+                else:
+                    failures[custom_id] = error
+
+    if retry_path:
+        with open(retry_path, "w", encoding="utf-8") as f:
+            for custom_id, error in failures.items():
+                if custom_id not in index:
+                    f.write(json.dumps(
+                        {"custom_id": custom_id, "reason": error.reason, "detail": error.detail}
+                    ) + "\n")
+    return index
+
+
+def cost_line(input_tokens, cached_tokens, output_tokens, model=None, tier=pricing.DEFAULT_TIER):
+    input_cost = pricing.cost(input_tokens, 0, cached_tokens, model=model, tier=tier)
+    output_cost = pricing.cost(0, output_tokens, model=model, tier=tier)
+    return {
+        "input_tokens": input_tokens,
+        "cached_tokens": cached_tokens,
+        "output_tokens": output_tokens,
+        "cache_hit_rate": cached_tokens / input_tokens if input_tokens else 0.0,
+        "input_cost": input_cost,
+        "output_cost": output_cost,
+        "cost": input_cost + output_cost,
+        # What the cached input would have cost at the full input rate
+        "cache_savings": pricing.cost(input_tokens, 0, model=model, tier=tier) - input_cost,
+    }
+
+
+def usage_summary(job_manifest, index):
+    """Billed usage summed over every batch, falling back to decoded records.
+
+    Each batch is priced for its model from pricing.py (at the standard
+    rate when realtime.py ran it), with cached input tokens (the shared
+    prompt prefix) at the discounted rate. Every batch gets its own cache
+    hit rate, cost and estimated-vs-actual tokens.
+    """
+    per_shard = {}
+    for shard in job_manifest["shards"]:
+        usage = shard.get("usage")
+        if usage:
+            line = cost_line(usage["input_tokens"], results.cached_tokens(usage), usage["output_tokens"],
+                             shard.get("model"), pricing.shard_tier(shard))
+            line["estimated_tokens"] = shard["estimated_tokens"]
+            per_shard[shard["index"]] = line
+    lines = list(per_shard.values())
+    if not lines:
+        lines = [cost_line(
+            sum(record["prompt_tokens"] for record in index.values()),
+            sum(record.get("cached_tokens", 0) for record in index.values()),
+            sum(record["completion_tokens"] for record in index.values()),
+        )]
+
+    input_tokens = sum(line["input_tokens"] for line in lines)
+    cached_tokens = sum(line["cached_tokens"] for line in lines)
+    output_tokens = sum(line["output_tokens"] for line in lines)
+    input_cost = sum(line["input_cost"] for line in lines)
+    output_cost = sum(line["output_cost"] for line in lines)
+    return {
+        "batches": len(per_shard),
+        "input_tokens": input_tokens,
+        "cached_tokens": cached_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+        "cache_hit_rate": cached_tokens / input_tokens if input_tokens else 0.0,
+        "input_cost": input_cost,
+        "output_cost": output_cost,
+        "total_cost": input_cost + output_cost,
+        "cache_savings": sum(line["cache_savings"] for line in lines),
+        "shards": per_shard,
+    }
+
+
+def emit_usage_metrics(job, summary):
+    """Record per-shard tokens (estimated vs actual), cache hit rate and cost, plus job totals."""
+    for shard_index, line in summary["shards"].items():
+        labels = {"job": job, "shard": shard_index}
+        instrumentation.emit("estimated_tokens", line["estimated_tokens"], **labels)
+        instrumentation.emit("actual_tokens", line["input_tokens"] + line["output_tokens"], **labels)
+        instrumentation.emit("cached_tokens", line["cached_tokens"], **labels)
+        instrumentation.emit("cache_hit_rate", round(line["cache_hit_rate"], 4), **labels)
+        instrumentation.emit("cost_usd", round(line["cost"], 6), **labels)
+    instrumentation.emit("job_tokens", summary["total_tokens"], job=job)
+    instrumentation.emit("job_cost_usd", round(summary["total_cost"], 6), job=job)
+
+
+def print_usage_summary(summary, results_count):
+    print(f"\n=== JOB COST SUMMARY ({summary['batches']} batches, {results_count:,} results) ===")
+    for shard_index, line in sorted(summary["shards"].items()):
+        print(f"Shard {shard_index}: {line['input_tokens']:,} input ({line['cache_hit_rate']:.1%} cached), "
+              f"{line['output_tokens']:,} output (estimated {line['estimated_tokens']:,} total), ${line['cost']:.4f}")
+    print(f"Input tokens: {summary['input_tokens']:,}")
+    print(f"Cached input tokens: {summary['cached_tokens']:,} ({summary['cache_hit_rate']:.1%} cache hit rate)")
+    print(f"Output tokens: {summary['output_tokens']:,}")
+    print(f"Total tokens: {summary['total_tokens']:,}")
+    print(f"Input cost: ${summary['input_cost']:.6f}")
+    print(f"Output cost: ${summary['output_cost']:.6f}")
+    print(f"Total cost: ${summary['total_cost']:.2f} (prompt cache saved ${summary['cache_savings']:.2f})")
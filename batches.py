@@ -0,0 +1,229 @@
+"""Account-wide batch listing and bulk cancellation, backed by a local cache.
+
+Listing walks every page of /v1/batches (newest first, 100 per page)
+instead of the first ten. A batch in a terminal status never changes, so
+every batch seen is kept in batch_cache.json: once one full walk has been
+cached, later walks stop at the first page made only of cached terminal
+batches, and the older batches still open in the cache are refreshed with
+concurrent retrieve calls instead. Batches can be filtered by status,
+metadata and job (the "job" metadata set by submitter.py), and any
+selection is cancelled in parallel, so every shard of a bad run stops at
+once.
+
+    python batches.py list --status validating in_progress
+    python batches.py cancel --job job_1760000000
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import openai
+
+import manifest
+import submitter
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+BATCH_CACHE = os.path.join(current_dir, "batch_cache.json")
+PAGE_SIZE = 100  # the API maximum
+MAX_CONCURRENT_REQUESTS = 32
+
+
+def load_cache(cache_path=BATCH_CACHE):
+    """Return {"complete": bool, "batches": {batch_id: batch}}; complete once a walk reached the last page."""
+    if not os.path.exists(cache_path):
+        return {"complete": False, "batches": {}}
+    with open(cache_path, "r") as f:
+        return json.load(f)
+
+
+def save_cache(cache, cache_path=BATCH_CACHE):
+    # Write to a temp file and rename so a crash never leaves a half-written cache
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+
+
+def new_stats():
+    return {"pages": 0, "listed": 0, "refreshed": 0, "cached": 0, "seconds": 0.0}
+
+
+def is_terminal(batch):
+    return batch["status"] in manifest.TERMINAL_STATUSES
+
+
+def is_cancellable(batch):
+    return not is_terminal(batch) and batch["status"] != "cancelling"
+
+
+async def fetch_pages(client, cache, stats, refresh=False):
+    """Walk the listing newest first; returns {batch_id: batch} for every batch seen."""
+    seen = {}
+    after = None
+    while True:
+        # The cursor of each page is the last id of the previous one, so pages are fetched in sequence
+        page = await client.batches.list(limit=PAGE_SIZE, **({"after": after} if after else {}))
+        batches = [batch.model_dump() for batch in page.data]
+        stats["pages"] += 1
+        seen.update((batch["id"], batch) for batch in batches)
+        if not batches or not page.has_more:
+            cache["complete"] = True
+            return seen
+        # Everything older than a page of known, finished batches is already cached
+        if cache["complete"] and not refresh and all(
+            batch["id"] in cache["batches"] and is_terminal(batch) for batch in batches
+        ):
+            return seen
+        after = batches[-1]["id"]
+
+
+async def retrieve_batches(client, batch_ids, concurrency=MAX_CONCURRENT_REQUESTS):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def retrieve(batch_id):
+        async with semaphore:
+            try:
+                return (await client.batches.retrieve(batch_id)).model_dump()
+            except openai.OpenAIError as e:
+                print(f"Refreshing {batch_id} failed: {e}")
+                return None
+
+    return [batch for batch in await asyncio.gather(*(retrieve(batch_id) for batch_id in batch_ids)) if batch]
+
+
+async def list_batches(client=None, cache_path=BATCH_CACHE, refresh=False,
+                       concurrency=MAX_CONCURRENT_REQUESTS, stats=None):
+    """Every batch in the account, newest first; refresh=True walks all pages even with a complete cache."""
+    client = client or submitter.make_async_client()
+    stats = stats if stats is not None else new_stats()
+    started = time.perf_counter()
+    cache = load_cache(cache_path)
+
+    seen = await fetch_pages(client, cache, stats, refresh)
+    stale = [batch_id for batch_id, batch in cache["batches"].items() if batch_id not in seen and not is_terminal(batch)]
+    refreshed = await retrieve_batches(client, stale, concurrency)
+    seen.update((batch["id"], batch) for batch in refreshed)
+
+    stats["listed"] = len(seen) - len(refreshed)
+    stats["refreshed"] = len(refreshed)
+    stats["cached"] = sum(1 for batch_id in cache["batches"] if batch_id not in seen)
+    cache["batches"].update(seen)
+    save_cache(cache, cache_path)
+    stats["seconds"] = time.perf_counter() - started
+    return sorted(cache["batches"].values(), key=lambda batch: batch["created_at"], reverse=True)
+
+
+def parse_metadata(pairs):
+    """["key=value", ...] -> {key: value}"""
+    metadata = {}
+    for pair in pairs or []:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"Metadata filter {pair!r} is not KEY=VALUE")
+        metadata[key] = value
+    return metadata
+
+
+def select(batches, statuses=None, metadata=None, job=None):
+    """Batches matching any of the statuses and all of the metadata; job filters on the "job" metadata."""
+    metadata = dict(metadata or {}, **({"job": job} if job else {}))
+    return [
+        batch for batch in batches
+        if (not statuses or batch["status"] in statuses)
+        and all((batch.get("metadata") or {}).get(key) == value for key, value in metadata.items())
+    ]
+
+
+async def cancel_batches(client, batch_ids, concurrency=MAX_CONCURRENT_REQUESTS, cache_path=BATCH_CACHE):
+    """Cancel batches in parallel; returns {batch_id: new status, or None if the request failed}."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def cancel(batch_id):
+        async with semaphore:
+            try:
+                batch = await client.batches.cancel(batch_id)
+            except openai.OpenAIError as e:
+                print(f"Cancelling {batch_id} failed: {e}")
+                return batch_id, None
+        print(f"{batch_id} {batch.status}")
+        return batch_id, batch.model_dump()
+
+    cancelled = dict(await asyncio.gather(*(cancel(batch_id) for batch_id in batch_ids)))
+    cache = load_cache(cache_path)
+    cache["batches"].update((batch_id, batch) for batch_id, batch in cancelled.items() if batch)
+    save_cache(cache, cache_path)
+    return {batch_id: batch["status"] if batch else None for batch_id, batch in cancelled.items()}
+
+
+def print_batches(batches):
+    for batch in batches:
+        counts = batch.get("request_counts") or {}
+        metadata = batch.get("metadata") or {}
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(batch["created_at"]))
+        print(f"{batch['id']:<38} {created}  {batch['status']:<11} "
+              f"{counts.get('completed', 0):>9,} / {counts.get('total', 0):<9,} failed {counts.get('failed', 0):<7,} "
+              f"{metadata.get('job', '')} {metadata.get('shard', '')}".rstrip())
+
+
+def print_stats(stats):
+    print(f"{stats['pages']} page(s), {stats['listed']:,} batches listed, {stats['refreshed']:,} refreshed, "
+          f"{stats['cached']:,} from the cache in {stats['seconds']:.2f}s")
+
+
+def add_filter_arguments(parser):
+    parser.add_argument("--status", nargs="+", default=None, help="keep batches in any of these statuses")
+    parser.add_argument("--metadata", nargs="+", default=None, metavar="KEY=VALUE", help="keep batches with this metadata")
+    parser.add_argument("--job", default=None, help="keep batches submitted for this job")
+    parser.add_argument("--refresh", action="store_true", help="walk every page even if the cache is complete")
+
+
+async def list_selected(args, client=None):
+    stats = new_stats()
+    batches = await list_batches(client, refresh=args.refresh, stats=stats)
+    return select(batches, args.status, parse_metadata(args.metadata), args.job), stats
+
+
+async def cancel_selected(args):
+    client = submitter.make_async_client()
+    batch_ids = list(args.batch_ids)
+    if args.status or args.metadata or args.job:
+        selected, _ = await list_selected(args, client)
+        batch_ids += [batch["id"] for batch in selected if is_cancellable(batch) and batch["id"] not in batch_ids]
+    print(f"Cancelling {len(batch_ids)} batch(es)")
+    return await cancel_batches(client, batch_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="list every batch in the account")
+    add_filter_arguments(list_parser)
+    list_parser.add_argument("--json", action="store_true", help="print the batches as JSON")
+
+    cancel_parser = commands.add_parser("cancel", help="cancel the given or every matching unfinished batch")
+    cancel_parser.add_argument("batch_ids", nargs="*")
+    add_filter_arguments(cancel_parser)
+    args = parser.parse_args()
+
+    if args.command == "list":
+        selected, stats = asyncio.run(list_selected(args))
+        if args.json:
+            print(json.dumps(selected, indent=2))
+            return
+        print_batches(selected)
+        print_stats(stats)
+        return
+
+    if not (args.batch_ids or args.status or args.metadata or args.job):
+        # An unfiltered cancel would stop every batch in the organization
+        parser.error("cancel needs batch ids or at least one of --status, --metadata, --job")
+    statuses = asyncio.run(cancel_selected(args))
+    failed = sum(1 for status in statuses.values() if status is None)
+    print(f"Cancelled {len(statuses) - failed} batch(es), {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Compare the old whole-file output parsing in 4_get_batch.py with results.py.
+
+The old path held output_file.text, the split lines and the parsed list in
+memory at once; the new path streams the file to disk and parses one line
+at a time. Both build the same list of records.
+
+    python benchmarks/bench_output_parsing.py --lines 50000
+"""
+import argparse
+import ast
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import results  # noqa: E402
+from synthetic import write_output_file  # noqa: E402
+
+
+def legacy_records(source_path, raw_path):
+    # Mirrors the original 4_get_batch.py: full text in memory, written, split and parsed
+    with open(source_path, "r", encoding="utf-8") as f:
+        text = f.read()
+    with open(raw_path, "w") as f:
+        f.write(text)
+    lines = text.strip().split("\n")
+    data = [json.loads(line) for line in lines]
+
+    records = []
+    for item in data:
+        response_body = item["response"]["body"]
+        message_output = next(o for o in response_body["output"] if o.get("type") == "message")
+        parsed = ast.literal_eval(message_output["content"][0]["text"])
+        usage = response_body.get("usage", {})
+        records.append({
+            "custom_id": item.get("custom_id"),
+            "hear_source": parsed.get("hear_source", ""),
+            "hear_source_detail": parsed.get("hear_source_detail", ""),
+            "prompt_tokens": usage.get("input_tokens", 0),
+            "completion_tokens": usage.get("output_tokens", 0),
+            "total_tokens": usage.get("total_tokens", 0),
+        })
+    return records
+
+
+def streaming_records(source_path, raw_path):
+    # Chunked copy stands in for results.download_to_file
+    with open(source_path, "rb") as src, open(raw_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, results.DOWNLOAD_CHUNK_BYTES)
+    return list(results.iter_records(raw_path))
+
+
+def measure(name, fn, *args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    records = fn(*args)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<10} {len(records):>8,} records  {elapsed:7.2f}s  peak {peak / 1024 / 1024:8.1f} MB")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=50000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source_path = write_output_file(os.path.join(tmp, "output.jsonl"), args.lines)
+        size_mb = os.path.getsize(source_path) / 1024 / 1024
+        print(f"Synthetic output: {args.lines:,} lines, {size_mb:.1f} MB")
+
+        legacy = measure("legacy", legacy_records, source_path, os.path.join(tmp, "legacy.jsonl"))
+        streaming = measure("streaming", streaming_records, source_path, os.path.join(tmp, "streaming.jsonl"))
+        assert [r["hear_source"] for r in legacy] == [r["hear_source"] for r in streaming]
+
+
+if __name__ == "__main__":
+    main()
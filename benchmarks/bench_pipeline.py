@@ -0,0 +1,226 @@
+"""End-to-end pipeline benchmark against the local mock API.
+
+For each requested size a synthetic Input.csv is generated (realistic
+share of repeated answers), then every stage runs for real against
+benchmarks/mock_api.py in a subprocess: sharding with the 1b request
+builder, upload and batch creation, polling and download (or realtime.py
+with --realtime), and the 4_get_batch.py ingestion (decode, fan-out and
+merge with Input.csv). Each stage runs in its own interpreter and reports
+wall time, throughput and its own peak memory; --json saves the report as
+a regression baseline.
+
+    python benchmarks/bench_pipeline.py --rows 10000 100000 --dedup --fast-path --json baseline.json
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import openai  # noqa: E402
+
+import aggregate  # noqa: E402
+import instrumentation  # noqa: E402
+import manifest  # noqa: E402
+import merge  # noqa: E402
+import poller  # noqa: E402
+import realtime  # noqa: E402
+import results  # noqa: E402
+import sharder  # noqa: E402
+import submitter  # noqa: E402
+from synthetic import write_input_csv  # noqa: E402
+from token_cache import TokenCache  # noqa: E402
+
+DEFAULT_ROWS = [10000]
+POLL_SECONDS = 0.2  # the mock finishes in seconds, so poll far more often than against the real API
+
+
+def load_converter(work_dir):
+    """Import 1b_csv_to_jsonl_hardcoded_prompt.py with its token cache in work_dir."""
+    path = os.path.join(REPO_DIR, "1b_csv_to_jsonl_hardcoded_prompt.py")
+    spec = importlib.util.spec_from_file_location("converter", path)
+    converter = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(converter)
+    # A fresh token cache per run, so every size starts cold
+    converter.token_cache = TokenCache(converter.enc, path=os.path.join(work_dir, "token_cache.sqlite"))
+    return converter
+
+
+def start_mock(lines_per_second):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "mock_api.py"), "--lines-per-second", str(lines_per_second)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    base_url = process.stdout.readline().strip().rsplit(" ", 1)[-1]
+    return process, base_url
+
+
+def stage_shard(work_dir, options):
+    # Same call as process_csv, with the manifest kept in the work directory
+    converter = load_converter(work_dir)
+    input_overhead = converter.input_overhead_tokens()
+    dedup_map_path = os.path.join(work_dir, "dedup_map.csv") if options["dedup"] else None
+    fast_path_path = os.path.join(work_dir, "fast_path.csv") if options["fast_path"] else None
+    _, shards = sharder.shard_csv(
+        options["input_csv"],
+        converter.create_json_entry,
+        lambda json_entries: converter.estimate_request_tokens_batch(json_entries, input_overhead=input_overhead),
+        lambda index: converter.batch_path(index, work_dir),
+        int(converter.MAX_TOKENS_PER_BATCH * (1 - converter.TOKEN_SAFETY_MARGIN)),
+        converter.MAX_LINES_PER_BATCH,
+        dedup_map_path=dedup_map_path,
+        fast_path_path=fast_path_path,
+        max_bytes_per_batch=converter.MAX_BYTES_PER_BATCH,
+    )
+    converter.token_cache.close()
+    manifest.save(manifest.new_manifest(
+        [dict(shard, model=converter.MODEL) for shard in shards],
+        input_csv=options["input_csv"],
+        dedup_map_path=dedup_map_path,
+        fast_path_path=fast_path_path,
+    ), options["manifest_path"])
+    return shards
+
+
+def make_client(options):
+    return openai.AsyncOpenAI(base_url=options["base_url"], api_key="mock")
+
+
+def stage_realtime(work_dir, options):
+    return asyncio.run(realtime.run(options["manifest_path"], options["rpm"], options["tpm"],
+                                    options["concurrency"], client=make_client(options)))
+
+
+def stage_submit(work_dir, options):
+    # No enqueued-token limit on the mock, so every shard is submitted at once
+    budget = sum(shard["estimated_tokens"] for shard in manifest.load(options["manifest_path"])["shards"])
+    return asyncio.run(submitter.submit_all(options["manifest_path"], token_budget=budget, client=make_client(options)))
+
+
+def stage_poll(work_dir, options):
+    poller.MIN_POLL_SECONDS = POLL_SECONDS
+    poller.MAX_POLL_SECONDS = POLL_SECONDS * 10
+    poller.SECONDS_PER_1000_LINES = 0
+    asyncio.run(poller.run(options["manifest_path"], make_client(options)))
+
+
+def stage_ingest(work_dir, options):
+    # Same steps as 4_get_batch.py after the download
+    job_manifest = manifest.load(options["manifest_path"])
+    decode_stats = results.new_stats()
+    index = aggregate.build_index(job_manifest, os.path.join(work_dir, "retry.jsonl"), decode_stats)
+    instrumentation.emit_stages(decode_stats["timings"], job=job_manifest["job"])
+    return merge.merge_job(
+        index,
+        job_manifest["input_csv"],
+        os.path.join(work_dir, "output_hear_about.csv"),
+        job_manifest,
+        fast_path_path=job_manifest.get("fast_path_path"),
+        dedup_map_path=job_manifest.get("dedup_map_path"),
+    )
+
+
+STAGES = {
+    "shard": stage_shard,
+    "realtime": stage_realtime,
+    "submit": stage_submit,
+    "poll": stage_poll,
+    "ingest": stage_ingest,
+}
+
+
+def run_stage(stage, work_dir, options):
+    """Run one stage in this (fresh) process; returns its timing and memory row and its result."""
+    # Stage metrics from the pipeline modules go to the work directory, not the repo
+    instrumentation.METRICS_JSONL = os.path.join(work_dir, "metrics.jsonl")
+    if options["trace_memory"]:
+        tracemalloc.start()
+    output = contextlib.nullcontext() if options["verbose"] else contextlib.redirect_stdout(io.StringIO())
+    started = time.perf_counter()
+    with output:
+        value = STAGES[stage](work_dir, options)
+    row = {"seconds": time.perf_counter() - started, "peak_rss_mb": sharder.peak_rss_mb()}
+    if options["trace_memory"]:
+        row["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    return row, value
+
+
+def measure(report, stage, items, unit, work_dir, options):
+    """Run one stage in its own interpreter, so ru_maxrss is that stage's peak and not an earlier one."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        row, value = pool.apply(run_stage, (stage, work_dir, options))
+    row = {"stage": stage, "items": items, "unit": unit,
+           "items_per_sec": items / row["seconds"] if row["seconds"] > 0 else 0.0, **row}
+    report.append(row)
+    print(f"  {stage:<10} {row['seconds']:8.2f}s  {row['items_per_sec']:>12,.0f} {unit}/s  "
+          f"RSS {row['peak_rss_mb']:8.1f} MB"
+          + (f"  traced {row['peak_traced_mb']:8.1f} MB" if options["trace_memory"] else ""))
+    return value
+
+
+def run_size(rows, args, base_url):
+    work_dir = tempfile.mkdtemp(prefix=f"bench_{rows}_")
+    input_csv = write_input_csv(os.path.join(work_dir, "Input.csv"), rows, seed=rows)
+    options = dict(vars(args), base_url=base_url, input_csv=input_csv,
+                   manifest_path=os.path.join(work_dir, "batch_manifest.json"))
+    report = []
+    print(f"\n{rows:,} rows ({os.path.getsize(input_csv) / 1024 / 1024:.1f} MB Input.csv) in {work_dir}")
+
+    shards = measure(report, "shard", rows, "rows", work_dir, options)
+    requests = sum(shard["lines"] for shard in shards)
+    if args.realtime:
+        measure(report, "realtime", requests, "requests", work_dir, options)
+    else:
+        measure(report, "submit", requests, "requests", work_dir, options)
+        measure(report, "poll", requests, "requests", work_dir, options)
+    merge_stats = measure(report, "ingest", rows, "rows", work_dir, options)
+
+    print(f"  {requests:,} requests in {len(shards)} shard(s); merged {merge_stats['merged_rows']:,} rows")
+    return {"rows": rows, "requests": requests, "shards": len(shards),
+            "merged_rows": merge_stats["merged_rows"], "stages": report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="Input.csv sizes, e.g. 10000 5000000")
+    parser.add_argument("--dedup", action="store_true", help="one request per unique answer")
+    parser.add_argument("--fast-path", action="store_true", help="classify obvious answers locally")
+    parser.add_argument("--realtime", action="store_true", help="run realtime.py instead of submit + poll")
+    parser.add_argument("--rpm", type=int, default=1_000_000)
+    parser.add_argument("--tpm", type=int, default=10_000_000_000)
+    parser.add_argument("--concurrency", type=int, default=realtime.MAX_CONCURRENT_REQUESTS)
+    parser.add_argument("--lines-per-second", type=float, default=50000, help="mock batch processing speed")
+    parser.add_argument("--trace-memory", action="store_true", help="also report tracemalloc peaks (slower)")
+    parser.add_argument("--verbose", action="store_true", help="show each stage's own output")
+    parser.add_argument("--json", default=None, help="save the report to this path")
+    args = parser.parse_args()
+
+    process, base_url = start_mock(args.lines_per_second)
+    try:
+        print(f"Mock API at {base_url}")
+        runs = [run_size(rows, args, base_url) for rows in args.rows]
+    finally:
+        process.terminate()
+        process.wait()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"created_at": int(time.time()), "options": vars(args), "runs": runs}, f, indent=2)
+        print(f"\nReport saved to: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
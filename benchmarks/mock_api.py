@@ -0,0 +1,261 @@
+"""Local mock of the OpenAI Files, Batches and Responses endpoints.
+
+Uploaded files are kept in a data directory. A batch moves through
+validating -> in_progress -> completed on a simulated clock (its lines
+processed at --lines-per-second, with request_counts advancing as it
+goes), and its output file is generated from the input file with
+synthetic answers and usage when it completes. /v1/responses answers
+single requests for realtime.py. Point the pipeline at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+    python benchmarks/mock_api.py --port 8765 --lines-per-second 50000
+"""
+import argparse
+import email.parser
+import email.policy
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import answer_for, output_line  # noqa: E402
+
+LINES_PER_SECOND = 50000
+VALIDATING_SECONDS = 0.2
+CHUNK_BYTES = 1024 * 1024
+
+
+class MockState:
+    def __init__(self, data_dir, lines_per_second=LINES_PER_SECOND):
+        self.data_dir = data_dir
+        self.lines_per_second = lines_per_second
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+        self.rng = random.Random(0)
+
+    def add_file(self, data=None, purpose="batch", filename="upload.jsonl"):
+        file_id = f"file-{uuid.uuid4().hex}"
+        path = os.path.join(self.data_dir, file_id)
+        if data is not None:
+            with open(path, "wb") as f:
+                f.write(data)
+        self.files[file_id] = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(data) if data is not None else 0,
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "path": path,
+        }
+        return self.files[file_id]
+
+    def create_batch(self, params):
+        input_file = self.files[params["input_file_id"]]
+        with open(input_file["path"], "rb") as f:
+            lines = sum(1 for line in f if line.strip())
+        now = time.time()
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": params["endpoint"],
+            "errors": None,
+            "input_file_id": input_file["id"],
+            "completion_window": params["completion_window"],
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(now),
+            "in_progress_at": None,
+            "expires_at": int(now) + 86400,
+            "finalizing_at": None,
+            "completed_at": None,
+            "failed_at": None,
+            "expired_at": None,
+            "cancelling_at": None,
+            "cancelled_at": None,
+            "request_counts": {"total": lines, "completed": 0, "failed": 0},
+            "metadata": params.get("metadata") or {},
+            "usage": None,
+            "_created": now,
+        }
+        self.batches[batch["id"]] = batch
+        return batch
+
+    def advance(self, batch):
+        """Move a batch along the simulated clock; generates its output on completion."""
+        if batch["status"] in ("completed", "cancelled", "failed", "expired"):
+            return batch
+        elapsed = time.time() - batch["_created"] - VALIDATING_SECONDS
+        if elapsed < 0:
+            return batch
+        total = batch["request_counts"]["total"]
+        if batch["status"] == "cancelling":
+            batch.update(status="cancelled", cancelled_at=int(time.time()))
+            return batch
+        batch["status"] = "in_progress"
+        batch["in_progress_at"] = batch["in_progress_at"] or int(time.time())
+        done = min(total, int(elapsed * self.lines_per_second))
+        batch["request_counts"]["completed"] = done
+        if done >= total:
+            self.finish(batch)
+        return batch
+
+    def finish(self, batch):
+        output = self.add_file(purpose="batch_output", filename=f"{batch['id']}_output.jsonl")
+        usage = {"input_tokens": 0, "input_tokens_details": {"cached_tokens": 0},
+                 "output_tokens": 0, "output_tokens_details": {"reasoning_tokens": 0}, "total_tokens": 0}
+        with open(self.files[batch["input_file_id"]]["path"], "rb") as src, open(output["path"], "w") as dst:
+            for line in src:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                item = output_line(entry["custom_id"], answer_for(entry["body"].get("input"), self.rng), self.rng)
+                body_usage = item["response"]["body"]["usage"]
+                for key in ("input_tokens", "output_tokens", "total_tokens"):
+                    usage[key] += body_usage[key]
+                usage["input_tokens_details"]["cached_tokens"] += body_usage["input_tokens_details"]["cached_tokens"]
+                usage["output_tokens_details"]["reasoning_tokens"] += body_usage["output_tokens_details"]["reasoning_tokens"]
+                dst.write(json.dumps(item) + "\n")
+        output["bytes"] = os.path.getsize(output["path"])
+        now = int(time.time())
+        batch.update(status="completed", output_file_id=output["id"], finalizing_at=now, completed_at=now, usage=usage)
+
+    def respond(self, body):
+        item = output_line(f"rt_{uuid.uuid4().hex[:12]}", answer_for(body.get("input"), self.rng), self.rng)
+        return item["response"]["body"]
+
+
+def public(obj):
+    return {key: value for key, value in obj.items() if not key.startswith("_") and key != "path"}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, obj, status=200):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.send_header("x-request-id", f"req_{uuid.uuid4().hex[:16]}")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def not_found(self):
+        self.send_json({"error": {"message": f"No route for {self.path}", "type": "invalid_request_error"}}, 404)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("content-length", 0)))
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        state = self.state
+        if match := re.fullmatch(r"/v1/files/([\w-]+)/content", path):
+            file = state.files.get(match.group(1))
+            if file is None:
+                return self.not_found()
+            self.send_response(200)
+            self.send_header("content-type", "application/octet-stream")
+            self.send_header("content-length", str(os.path.getsize(file["path"])))
+            self.end_headers()
+            with open(file["path"], "rb") as f:
+                while chunk := f.read(CHUNK_BYTES):
+                    self.wfile.write(chunk)
+            return None
+        if match := re.fullmatch(r"/v1/batches/([\w-]+)", path):
+            with state.lock:
+                batch = state.batches.get(match.group(1))
+                if batch is None:
+                    return self.not_found()
+                return self.send_json(public(state.advance(batch)))
+        if path == "/v1/batches":
+            params = dict(part.split("=", 1) for part in query.split("&") if "=" in part)
+            limit = int(params.get("limit", 20))
+            with state.lock:
+                # Newest first, like the real API
+                batches = [state.advance(batch) for batch in reversed(state.batches.values())]
+            ids = [batch["id"] for batch in batches]
+            start = ids.index(params["after"]) + 1 if params.get("after") in ids else 0
+            page = [public(batch) for batch in batches[start:start + limit]]
+            return self.send_json({
+                "object": "list",
+                "data": page,
+                "first_id": page[0]["id"] if page else None,
+                "last_id": page[-1]["id"] if page else None,
+                "has_more": start + limit < len(batches),
+            })
+        return self.not_found()
+
+    def do_POST(self):
+        path = self.path.partition("?")[0]
+        state = self.state
+        body = self.read_body()
+        if path == "/v1/files":
+            # Parse the multipart upload with the stdlib email parser
+            message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                f"content-type: {self.headers['content-type']}\r\n\r\n".encode("utf-8") + body
+            )
+            fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+            upload = fields["file"]
+            with state.lock:
+                file = state.add_file(upload.get_payload(decode=True), fields["purpose"].get_content().strip(),
+                                      upload.get_filename() or "upload.jsonl")
+            return self.send_json(public(file))
+        if path == "/v1/batches":
+            with state.lock:
+                return self.send_json(public(state.create_batch(json.loads(body))))
+        if match := re.fullmatch(r"/v1/batches/([\w-]+)/cancel", path):
+            with state.lock:
+                batch = state.batches.get(match.group(1))
+                if batch is None:
+                    return self.not_found()
+                if batch["status"] in ("validating", "in_progress"):
+                    batch.update(status="cancelling", cancelling_at=int(time.time()))
+                return self.send_json(public(batch))
+        if path == "/v1/responses":
+            return self.send_json(state.respond(json.loads(body)))
+        return self.not_found()
+
+
+def serve(port=0, data_dir=None, lines_per_second=LINES_PER_SECOND):
+    """Start the mock in a background thread; returns the server (server.server_port is the port)."""
+    data_dir = data_dir or tempfile.mkdtemp(prefix="mock_api_")
+    handler = type("BoundHandler", (Handler,), {"state": MockState(data_dir, lines_per_second)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--data-dir", default=None)
+    parser.add_argument("--lines-per-second", type=float, default=LINES_PER_SECOND)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.data_dir, args.lines_per_second)
+    # The benchmark reads the port from this line
+    print(f"Mock API listening on http://127.0.0.1:{server.server_port}/v1", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Synthetic inputs and batch outputs for the benchmarks."""
+import csv
+import json
+import random
+
+ANSWERS = [
+    ("Google", "Organic - Search", "Google"),
+    ("found you on google", "Organic - Search", "Google"),
+    ("a friend", "Referral - WOM", ""),
+    ("asked ChatGPT", "Organic - AI", "ChatGPT"),
+    ("reddit ad", "Paid - Social", "Reddit"),
+    ("watched a youtube tutorial", "Organic - Social", "YouTube"),
+    ("alternative to twilio", "Organic - Search", "Comparison"),
+    ("met you at MWC Barcelona", "Tradeshow", "MWC"),
+]
+
+# Long-tail answers are assembled from these, so most of them are unique
+TAIL_WORDS = ["saw", "a", "post", "about", "your", "sms", "api", "on", "linkedin", "colleague", "mentioned",
+              "voice", "pricing", "blog", "comparison", "podcast", "webinar", "search", "sip", "trunking"]
+UNIQUE_SHARE = 0.25  # share of answers that are long-tail free text; the rest repeat a common answer
+EMPTY_SHARE = 0.05
+ZIPF_WEIGHTS = [1 / rank for rank in range(1, len(ANSWERS) + 1)]
+
+
+def input_answer(rng):
+    """A how_hear answer: mostly Zipf-distributed repeats of ANSWERS in varied casing, some free text."""
+    roll = rng.random()
+    if roll < EMPTY_SHARE:
+        return ""
+    if roll < EMPTY_SHARE + UNIQUE_SHARE:
+        return " ".join(rng.choice(TAIL_WORDS) for _ in range(rng.randint(3, 12)))
+    answer = rng.choices(ANSWERS, ZIPF_WEIGHTS)[0][0]
+    variant = rng.random()
+    if variant < 0.2:
+        return answer.lower()
+    if variant < 0.3:
+        return f"  {answer.upper()} "
+    return answer
+
+
+def write_input_csv(path, rows, seed=0):
+    """Write an Input.csv-shaped export with `rows` leads and a realistic share of duplicate answers."""
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "email", "company", "country", "how_hear"])
+        for i in range(rows):
+            writer.writerow([f"lead_{i}", f"user{i}@example.com", f"Company {i % 5000}",
+                             rng.choice(["US", "GB", "DE", "IE", "NL"]), input_answer(rng)])
+    return path
+
+
+def answer_for(text, rng):
+    """The ANSWERS entry matching a request input, or a random one for free text."""
+    normalized = (text or "").strip().lower()
+    for answer in ANSWERS:
+        if answer[0].lower() == normalized:
+            return answer
+    return rng.choice(ANSWERS)
+
+
+def output_line(custom_id, answer, rng):
+    _, hear_source, hear_source_detail = answer
+    text = json.dumps({"hear_source": hear_source, "hear_source_detail": hear_source_detail})
+    input_tokens = 2085 + rng.randint(0, 20)
+    output_tokens = rng.randint(15, 60)
+    return {
+        "id": f"batch_req_{custom_id}",
+        "custom_id": custom_id,
+        "response": {
+            "status_code": 200,
+            "request_id": f"req_{custom_id}",
+            "body": {
+                "id": f"resp_{custom_id}",
+                "object": "response",
+                "status": "completed",
+                "model": "gpt-5-2025-08-07",
+                "output": [
+                    {"id": f"rs_{custom_id}", "type": "reasoning", "summary": []},
+                    {
+                        "id": f"msg_{custom_id}",
+                        "type": "message",
+                        "status": "completed",
+                        "role": "assistant",
+                        "content": [{"type": "output_text", "annotations": [], "text": text}],
+                    },
+                ],
+                "usage": {
+                    "input_tokens": input_tokens,
+                    "input_tokens_details": {"cached_tokens": 1920},
+                    "output_tokens": output_tokens,
+                    "output_tokens_details": {"reasoning_tokens": output_tokens - 12},
+                    "total_tokens": input_tokens + output_tokens,
+                },
+            },
+        },
+        "error": None,
+    }
+
+
+def write_output_file(path, lines, seed=0):
+    """Write a batch output file with `lines` successful responses."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(lines):
+            f.write(json.dumps(output_line(f"lead_{i}", rng.choice(ANSWERS), rng)) + "\n")
+    return path
@@ -0,0 +1,162 @@
+"""Fit per-request token overhead from real batch usage.
+
+The CSV-to-JSONL scripts estimate each request as
+    input text tokens + fixed overhead + MAX_TOKENS
+where the fixed overhead (prompt, instructions, schema and framing) used to
+be hardcoded from one call. This module compares the estimated input text
+tokens of every submitted request with the `usage.input_tokens` reported in
+the downloaded batch output and stores the fitted overhead per model/prompt
+variant in calibration.json, which the scripts pick up automatically.
+Shards and their downloaded outputs are read from the job manifest unless
+globs are given.
+
+    python calibration.py --manifest jobs/job_1760000000/manifest.json
+    python calibration.py --outputs output_hear_about.jsonl --shards "hear_about_batch_*.jsonl"
+"""
+import argparse
+import glob
+import hashlib
+import json
+import math
+import os
+
+import manifest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+CALIBRATION_JSON = os.path.join(current_dir, "calibration.json")
+BASE_MODEL = "gpt-4o"  # token estimator, same as the CSV-to-JSONL scripts
+OVERHEAD_QUANTILE = 0.99
+# Downloaded output and error files sit next to the shards and match the same glob
+OUTPUT_SUFFIXES = ("_output.jsonl", "_errors.jsonl")
+
+
+def variant_key(json_entry):
+    """Identify the model + prompt combination a request belongs to."""
+    body = json_entry.get("body", {})
+    prompt = body.get("prompt")
+    if prompt:
+        prompt_part = f"prompt:{prompt.get('id')}"
+    else:
+        fingerprint = json.dumps(
+            {"instructions": body.get("instructions"), "text": body.get("text")}, sort_keys=True
+        )
+        prompt_part = "instructions:" + hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:12]
+    return f"{body.get('model')}|{prompt_part}"
+
+
+def load_input_overhead(variant, calibration_path=CALIBRATION_JSON):
+    """Return the fitted input overhead for a variant, or None if it was never calibrated."""
+    if not os.path.exists(calibration_path):
+        return None
+    with open(calibration_path, "r") as f:
+        fitted = json.load(f).get(variant)
+    return fitted["input_overhead"] if fitted else None
+
+
+def iter_jsonl(paths):
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def manifest_paths(job_manifest):
+    """(output paths, shard paths) of every shard whose output was downloaded."""
+    shards = [shard for shard in job_manifest["shards"]
+              if shard.get("output_path") and os.path.exists(shard["output_path"]) and os.path.exists(shard["path"])]
+    return [shard["output_path"] for shard in shards], [shard["path"] for shard in shards]
+
+
+def glob_shards(pattern):
+    return sorted(path for path in glob.glob(pattern) if not path.endswith(OUTPUT_SUFFIXES))
+
+
+def quantile(sorted_values, q):
+    index = min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1)
+    return sorted_values[max(index, 0)]
+
+
+def fit(output_paths, shard_paths, count_tokens):
+    """Return {variant: overhead stats} from batch outputs and the shards that produced them.
+
+    count_tokens(texts) -> list of token counts, e.g. TokenCache.count_batch.
+    """
+    submitted = {entry["custom_id"]: entry for entry in iter_jsonl(shard_paths)}
+
+    actual = {}
+    for item in iter_jsonl(output_paths):
+        response = item.get("response") or {}
+        usage = (response.get("body") or {}).get("usage") or {}
+        if response.get("status_code") == 200 and "input_tokens" in usage and item.get("custom_id") in submitted:
+            actual[item["custom_id"]] = usage["input_tokens"]
+
+    custom_ids = list(actual)
+    inputs = [submitted[custom_id]["body"].get("input", "") for custom_id in custom_ids]
+    estimated = count_tokens(inputs)
+
+    samples = {}
+    for custom_id, t_input in zip(custom_ids, estimated):
+        variant = variant_key(submitted[custom_id])
+        samples.setdefault(variant, []).append(actual[custom_id] - t_input)
+
+    fitted = {}
+    for variant, overheads in samples.items():
+        overheads.sort()
+        fitted[variant] = {
+            # A high quantile rather than the mean so shards rarely overshoot the limit
+            "input_overhead": quantile(overheads, OVERHEAD_QUANTILE),
+            "median": quantile(overheads, 0.5),
+            "max": overheads[-1],
+            "samples": len(overheads),
+        }
+    return fitted
+
+
+def save(fitted, calibration_path=CALIBRATION_JSON):
+    existing = {}
+    if os.path.exists(calibration_path):
+        with open(calibration_path, "r") as f:
+            existing = json.load(f)
+    existing.update(fitted)
+    with open(calibration_path, "w") as f:
+        json.dump(existing, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--manifest", default=manifest.MANIFEST_JSON,
+                        help="job manifest listing the shards and their downloaded outputs")
+    parser.add_argument("--outputs", default=None, help="glob of downloaded batch output files instead")
+    parser.add_argument("--shards", default=None, help="glob of the JSONL shards that were submitted instead")
+    args = parser.parse_args()
+
+    output_paths, shard_paths = [], []
+    if not (args.outputs and args.shards):
+        job_manifest = manifest.load_if_exists(args.manifest)
+        if job_manifest is None:
+            raise SystemExit(f"No manifest at {args.manifest}; pass --outputs and --shards instead")
+        output_paths, shard_paths = manifest_paths(job_manifest)
+    if args.outputs:
+        output_paths = sorted(glob.glob(args.outputs))
+    if args.shards:
+        shard_paths = glob_shards(args.shards)
+
+    import tiktoken
+    from token_cache import TokenCache
+
+    token_cache = TokenCache(tiktoken.encoding_for_model(BASE_MODEL))
+    fitted = fit(output_paths, shard_paths, token_cache.count_batch)
+    if not fitted:
+        print("No successful requests found to calibrate from")
+        return
+
+    save(fitted)
+    for variant, stats in fitted.items():
+        print(f"{variant}: input overhead {stats['input_overhead']} tokens "
+              f"(median {stats['median']}, max {stats['max']}, {stats['samples']:,} samples)")
+    print(f"Calibration saved to: {CALIBRATION_JSON}")
+
+
+if __name__ == "__main__":
+    main()
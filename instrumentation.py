@@ -0,0 +1,145 @@
+"""Structured pipeline metrics: stage timings, token estimates vs actuals, cost.
+
+Every step appends events to metrics.jsonl, one JSON object per line
+({"ts", "metric", "value", "labels"}), labelled with the job and, where it
+applies, the shard and model. Stage timings cover read, tokenize,
+serialize and write (sharding), upload, queue_wait, processing, download,
+parse/decode/validate and merge. Running this module prints a per-job
+summary and writes metrics.prom in the Prometheus text format (latest value
+per series), e.g. for node_exporter's textfile collector.
+
+    python instrumentation.py --job job_1760000000
+"""
+import argparse
+import json
+import os
+import time
+from contextlib import contextmanager
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+METRICS_JSONL = os.path.join(current_dir, "metrics.jsonl")
+METRICS_PROM = os.path.join(current_dir, "metrics.prom")
+METRIC_PREFIX = "hear_about_"
+# Jobs run through pipeline.py keep their metrics in their own directory: {job: metrics path}
+JOB_METRICS = {}
+
+
+def emit(metric, value, metrics_path=None, **labels):
+    """Append one metric event; labels with a None value are left out."""
+    event = {
+        "ts": round(time.time(), 3),
+        "metric": metric,
+        "value": value,
+        "labels": {key: str(label) for key, label in labels.items() if label is not None},
+    }
+    metrics_path = metrics_path or JOB_METRICS.get(event["labels"].get("job")) or METRICS_JSONL
+    with open(metrics_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(event) + "\n")
+
+
+def emit_stage(stage, seconds, **labels):
+    emit("stage_seconds", round(seconds, 6), stage=stage, **labels)
+
+
+def emit_stages(timings, **labels):
+    """Emit a {stage: seconds} dict such as the sharder or decoder timings."""
+    for stage, seconds in timings.items():
+        emit_stage(stage, seconds, **labels)
+
+
+@contextmanager
+def timed(stage, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        emit_stage(stage, time.perf_counter() - started, **labels)
+
+
+def iter_events(metrics_path=None):
+    metrics_path = metrics_path or METRICS_JSONL
+    if not os.path.exists(metrics_path):
+        return
+    with open(metrics_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def latest_series(events):
+    """Return {(metric, sorted label items): value}, keeping the latest value of each series."""
+    series = {}
+    for event in events:
+        series[(event["metric"], tuple(sorted(event["labels"].items())))] = event["value"]
+    return series
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def prometheus_text(events):
+    lines = []
+    typed = set()
+    for (metric, labels), value in sorted(latest_series(events).items()):
+        name = METRIC_PREFIX + metric
+        if name not in typed:
+            lines.append(f"# TYPE {name} gauge")
+            typed.add(name)
+        label_text = ",".join(f'{key}="{escape_label(label)}"' for key, label in labels)
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(metrics_path=None, prom_path=METRICS_PROM):
+    # Write to a temp file and rename so a scraper never reads a half-written file
+    tmp_path = prom_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(prometheus_text(iter_events(metrics_path)))
+    os.replace(tmp_path, prom_path)
+    return prom_path
+
+
+def summary(events, job=None):
+    """Per-stage totals and per-shard token and cost figures for one job (or all jobs)."""
+    stages = {}
+    shards = {}
+    for event in events:
+        labels = event["labels"]
+        if job and labels.get("job") != job:
+            continue
+        if event["metric"] == "stage_seconds":
+            stage = stages.setdefault(labels["stage"], {"seconds": 0.0, "count": 0, "max": 0.0})
+            stage["seconds"] += event["value"]
+            stage["count"] += 1
+            stage["max"] = max(stage["max"], event["value"])
+        elif "shard" in labels:
+            shards.setdefault(labels["shard"], {})[event["metric"]] = event["value"]
+    return {"stages": stages, "shards": shards}
+
+
+def print_summary(report):
+    print("Stage timings:")
+    for stage, totals in report["stages"].items():
+        print(f"  {stage:<12} {totals['seconds']:10.2f}s total over {totals['count']:,} "
+              f"(max {totals['max']:.2f}s)")
+    for shard, values in sorted(report["shards"].items(), key=lambda item: int(item[0]) if item[0].isdigit() else 0):
+        if "estimated_tokens" in values and values.get("actual_tokens"):
+            print(f"  Shard {shard}: {values['estimated_tokens']:,} estimated vs {values['actual_tokens']:,} actual "
+                  f"tokens ({values['estimated_tokens'] / values['actual_tokens']:.2f}x), "
+                  f"${values.get('cost_usd', 0):.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--metrics", default=METRICS_JSONL)
+    parser.add_argument("--prom", default=METRICS_PROM)
+    parser.add_argument("--job", default=None, help="summarize only this job")
+    args = parser.parse_args()
+
+    print_summary(summary(iter_events(args.metrics), args.job))
+    print(f"Prometheus metrics saved to: {write_prometheus(args.metrics, args.prom)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Job manifest: every shard of a run and the batch that was created for it.
+
+The CSV-to-JSONL scripts write one entry per shard (path, line count,
+estimated tokens, model); the submission and polling steps fill in the
+input file id, batch id and status as the job progresses. It replaces the
+single latest_batch_id.txt, so a job split into many shards is tracked in
+one place. Processes that run alongside each other save with save_changes,
+which merges their shard updates under a file lock.
+"""
+import copy
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_JSON = os.path.join(current_dir, "batch_manifest.json")
+
+# Batch statuses after which a batch no longer counts against the enqueued-token limit
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+MISSING = object()
+
+
+def new_manifest(shards, job=None, **fields):
+    """Start a manifest; extra fields (e.g. prompt_version) are stored at the job level."""
+    created_at = int(time.time())
+    return {
+        "job": job or f"job_{created_at}",
+        "created_at": created_at,
+        **fields,
+        "shards": [dict(shard, status="pending") for shard in shards],
+    }
+
+
+def load_if_exists(manifest_path=MANIFEST_JSON):
+    return load(manifest_path) if os.path.exists(manifest_path) else None
+
+
+def load(manifest_path=MANIFEST_JSON):
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+
+@contextmanager
+def locked(manifest_path=MANIFEST_JSON):
+    """Hold an exclusive lock on the manifest across a read-modify-write."""
+    with open(manifest_path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def write(manifest, manifest_path):
+    # Write to a temp file and rename so a crash never leaves a half-written manifest
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def save(manifest, manifest_path=MANIFEST_JSON):
+    with locked(manifest_path):
+        write(manifest, manifest_path)
+
+
+def snapshot(manifest):
+    """Copy of a manifest as loaded, to pass to save_changes later."""
+    return copy.deepcopy(manifest)
+
+
+def apply_changes(target, changed, base):
+    """Copy the keys of changed that differ from base onto target, removing the ones it dropped."""
+    for key in set(changed) | set(base):
+        if key == "shards" or changed.get(key, MISSING) == base.get(key, MISSING):
+            continue
+        if key in changed:
+            target[key] = changed[key]
+        else:
+            target.pop(key, None)
+
+
+def save_changes(manifest, base, manifest_path=MANIFEST_JSON):
+    """Save only what changed since base was loaded, on top of the manifest on disk.
+
+    The poller, the scheduler and pipeline.py can update one manifest at
+    the same time, each between long network calls; saving a stale copy
+    would drop a batch id another process saved meanwhile and get its shard
+    submitted twice. Returns the merged manifest.
+    """
+    with locked(manifest_path):
+        current = load(manifest_path)
+        apply_changes(current, manifest, base)
+        shards = {shard["index"]: shard for shard in current["shards"]}
+        base_shards = {shard["index"]: shard for shard in base["shards"]}
+        for shard in manifest["shards"]:
+            if shard["index"] not in shards:
+                current["shards"].append(shard)
+            else:
+                apply_changes(shards[shard["index"]], shard, base_shards.get(shard["index"], {}))
+        write(current, manifest_path)
+    return current
+
+
+def is_in_flight(shard):
+    return bool(shard.get("batch_id")) and shard.get("status") not in TERMINAL_STATUSES
+
+
+def is_pending(shard):
+    """Not submitted yet; shards given up on or run by realtime.py have a terminal status instead."""
+    return not shard.get("batch_id") and shard.get("status") not in TERMINAL_STATUSES
+
+
+def in_flight_tokens(manifest, model=None):
+    return sum(
+        shard["estimated_tokens"]
+        for shard in manifest["shards"]
+        if is_in_flight(shard) and (model is None or shard.get("model") == model)
+    )
+
+
+def batch_ids(manifest):
+    return [shard["batch_id"] for shard in manifest["shards"] if shard.get("batch_id")]
+
+
+def has_results(manifest):
+    """True once any shard was submitted as a batch or run by realtime.py."""
+    return any(shard.get("batch_id") or shard.get("downloaded") for shard in manifest["shards"])
@@ -0,0 +1,180 @@
+"""Out-of-core merge of batch results with Input.csv.
+
+Batch results are indexed by custom_id in a dict (or looked up in the
+SQLite results store), and Input.csv is streamed through that index a
+chunk at a time, writing output_hear_about.csv (or Parquet) incrementally.
+Wide CRM exports with millions of rows are never loaded into a DataFrame,
+and only the requested input columns are kept.
+"""
+import csv
+import os
+import time
+
+import instrumentation
+import sharder
+from results_store import RESULT_FIELDS, ResultsStore
+
+MERGE_CHUNK_SIZE = 50000
+USAGE_FIELDS = ["prompt_tokens", "completion_tokens", "total_tokens", "cost_usd"]
+
+
+def add_fast_path(index, fast_path_path):
+    """Add rows classified locally by rules.py to the index; returns how many were added."""
+    added = 0
+    with open(fast_path_path, newline='', encoding='utf-8') as csvfile:
+        for record in csv.DictReader(csvfile):
+            index.setdefault(record["custom_id"], record)
+            added += 1
+    return added
+
+
+def load_dedup_map(dedup_map_path):
+    """Return {id: canonical_id} for rows that were folded into another request."""
+    with open(dedup_map_path, newline='', encoding='utf-8') as csvfile:
+        return {
+            row["id"]: row["canonical_id"]
+            for row in csv.DictReader(csvfile)
+            if row["id"] != row["canonical_id"]
+        }
+
+
+def resolve(row_id, index, dedup_map):
+    record = index.get(row_id)
+    if record is None and row_id in dedup_map:
+        canonical = index.get(dedup_map[row_id])
+        if canonical is not None:
+            # Only the canonical request was billed; copies carry zero usage so cost totals stay correct
+            record = dict(canonical, **{field: 0 for field in USAGE_FIELDS})
+    return record
+
+
+def iter_merged_chunks(input_csv, index, dedup_map=None, columns=None, results_store=None,
+                       prompt_version=None, incremental=False, stats=None):
+    """Yield lists of merged output rows (INNER JOIN of Input.csv with the results)."""
+    dedup_map = dedup_map or {}
+    stats = stats if stats is not None else {"input_rows": 0, "merged_rows": 0}
+
+    for chunk in sharder.iter_chunks(sharder.iter_rows(input_csv), MERGE_CHUNK_SIZE):
+        stats["input_rows"] += len(chunk)
+        matched = []
+        for row in chunk:
+            record = resolve(row[sharder.ID_COLUMN], index, dedup_map)
+            if record is not None:
+                matched.append((row, record))
+
+        if results_store is not None and prompt_version:
+            # Remember results for incremental runs (see process_csv(incremental=True))
+            results_store.upsert(
+                [dict(record, **{sharder.ID_COLUMN: row[sharder.ID_COLUMN],
+                                 sharder.INPUT_COLUMN: row[sharder.INPUT_COLUMN]})
+                 for row, record in matched],
+                prompt_version,
+            )
+            if incremental:
+                # This run only classified the delta; the output still covers every classified lead
+                stored = results_store.lookup(chunk, prompt_version)
+                matched = [
+                    (row, stored[row[sharder.ID_COLUMN]])
+                    for row in chunk
+                    if row[sharder.ID_COLUMN] in stored
+                ]
+
+        merged = []
+        for row, record in matched:
+            out = {column: row.get(column, "") for column in columns} if columns else dict(row)
+            out.update((field, record[field]) for field in RESULT_FIELDS)
+            merged.append(out)
+        stats["merged_rows"] += len(merged)
+        yield merged
+
+
+def output_fieldnames(input_csv, columns=None):
+    return (columns or sharder.read_header(input_csv)) + RESULT_FIELDS
+
+
+def write_csv(chunks, output_path, fieldnames):
+    with open(output_path, 'w', newline='', encoding='utf-8') as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
+        writer.writeheader()
+        for chunk in chunks:
+            writer.writerows(chunk)
+
+
+def write_parquet(chunks, output_path, fieldnames):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet output needs pyarrow: pip install pyarrow")
+
+    # Usage columns may arrive as strings (fast-path CSV), so cast them explicitly
+    casts = {"prompt_tokens": int, "completion_tokens": int, "total_tokens": int, "cost_usd": float}
+    types = {int: pa.int64(), float: pa.float64()}
+    schema = pa.schema([(name, types[casts[name]] if name in casts else pa.string()) for name in fieldnames])
+    with pq.ParquetWriter(output_path, schema) as writer:
+        for chunk in chunks:
+            rows = [{name: casts[name](row[name]) if name in casts else row[name] for name in fieldnames}
+                    for row in chunk]
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+
+
+def merge_to_file(input_csv, output_path, index, output_format="csv", columns=None, **merge_options):
+    """Stream Input.csv through the results index into output_path; returns merge stats."""
+    stats = {"input_rows": 0, "merged_rows": 0}
+    chunks = iter_merged_chunks(input_csv, index, columns=columns, stats=stats, **merge_options)
+    fieldnames = output_fieldnames(input_csv, columns)
+    if output_format == "parquet":
+        write_parquet(chunks, output_path, fieldnames)
+    else:
+        write_csv(chunks, output_path, fieldnames)
+    return stats
+
+
+def merge_job(index, input_csv, output_path, job_manifest=None, fast_path_path=None, dedup_map_path=None,
+              output_format="csv", columns=None):
+    """Complete the index with fast-path and deduplicated rows and merge it with input_csv.
+
+    Shared by 4_get_batch.py and pipeline.py fetch; returns the merge stats,
+    or None when input_csv does not exist.
+    """
+    job_manifest = job_manifest or {}
+
+    # Add rows classified locally by rules.py (see process_csv(fast_path=True))
+    if fast_path_path and os.path.exists(fast_path_path):
+        added = add_fast_path(index, fast_path_path)
+        print(f"Added {added} locally classified rows from {fast_path_path}")
+
+    # Fan deduplicated results back out to every original row (see process_csv(dedup=True))
+    dedup_map = {}
+    if dedup_map_path and os.path.exists(dedup_map_path):
+        dedup_map = load_dedup_map(dedup_map_path)
+        print(f"Loaded {len(dedup_map)} deduplicated rows from {dedup_map_path}")
+
+    if not os.path.exists(input_csv):
+        print(f"File not found at {input_csv}")
+        return None
+
+    # Remember results for incremental runs (see process_csv(incremental=True))
+    prompt_version = job_manifest.get("prompt_version")
+    results_store = ResultsStore() if prompt_version else None
+    started = time.perf_counter()
+    try:
+        # Stream Input.csv through the results index: INNER JOIN, written chunk by chunk
+        stats = merge_to_file(
+            input_csv,
+            output_path,
+            index,
+            output_format=output_format,
+            columns=columns,
+            dedup_map=dedup_map,
+            results_store=results_store,
+            prompt_version=prompt_version,
+            incremental=job_manifest.get("incremental", False),
+        )
+    finally:
+        if results_store is not None:
+            results_store.close()
+    instrumentation.emit_stage("merge", time.perf_counter() - started, job=job_manifest.get("job"))
+    print(f"Merged {stats['merged_rows']:,} of {stats['input_rows']:,} input rows")
+    print(f"Filtered and merged results saved to {output_path}")
+    return stats
@@ -0,0 +1,340 @@
+"""Single entry point for the whole pipeline, with one directory per job.
+
+Every run gets jobs/<job>/ holding its manifest, shards, dedup map,
+fast-path results, downloaded outputs, merged output and metrics, so any
+number of jobs can be prepared, submitted and polled side by side instead
+of sharing batch_manifest.json and the latest_*.txt files. Commands take a
+job id and default to the most recent job.
+
+Heavy dependencies (openai, tiktoken, jiter) are only imported by the
+commands that need them, so `list` starts with the standard library alone
+and `poll` does not load the tokenizer.
+
+    python pipeline.py prepare Input.csv --dedup --fast-path
+    python pipeline.py submit            # or --realtime for small, urgent jobs
+    python pipeline.py poll --wait       # every unfinished job, concurrently
+    python pipeline.py fetch
+    python pipeline.py cancel job_1760000000 --remote
+    python pipeline.py list                         # or --remote --status in_progress
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import time
+
+import manifest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+JOBS_DIR = os.path.join(current_dir, "jobs")
+JOB_MANIFEST = "manifest.json"
+VARIANTS = {
+    "hardcoded": "1b_csv_to_jsonl_hardcoded_prompt.py",
+    "prompt-id": "1a_csv_to_jsonl_prompt_id.py",
+}
+
+
+def job_dir(job):
+    return os.path.join(JOBS_DIR, job)
+
+
+def manifest_path(job):
+    return os.path.join(job_dir(job), JOB_MANIFEST)
+
+
+def iter_jobs():
+    """Yield (job, manifest) for every job directory, oldest first."""
+    if not os.path.isdir(JOBS_DIR):
+        return
+    jobs = []
+    for job in os.listdir(JOBS_DIR):
+        job_manifest = manifest.load_if_exists(manifest_path(job))
+        if job_manifest:
+            jobs.append((job_manifest.get("created_at", 0), job, job_manifest))
+    for _, job, job_manifest in sorted(jobs):
+        yield job, job_manifest
+
+
+def resolve_job(job=None):
+    """Accept a job id or directory; None means the most recent job."""
+    if job:
+        job = os.path.basename(os.path.normpath(job))
+        if not os.path.exists(manifest_path(job)):
+            raise SystemExit(f"No job {job} in {JOBS_DIR}")
+        return job
+    jobs = [job for job, _ in iter_jobs()]
+    if not jobs:
+        raise SystemExit(f"No jobs in {JOBS_DIR}; run `pipeline.py prepare` first")
+    return jobs[-1]
+
+
+def create_job_dir(job=None):
+    """Create a fresh job directory; generated ids get a suffix if another run took the same second."""
+    base = job or f"job_{int(time.time())}"
+    candidate, suffix = base, 1
+    while True:
+        try:
+            os.makedirs(job_dir(candidate))
+            return candidate
+        except FileExistsError:
+            if job:
+                raise SystemExit(f"Job {job} already exists")
+            suffix += 1
+            candidate = f"{base}_{suffix}"
+
+
+def use_job_metrics(job):
+    import instrumentation
+
+    instrumentation.JOB_METRICS[job] = os.path.join(job_dir(job), "metrics.jsonl")
+    return instrumentation
+
+
+def load_converter(variant):
+    # The conversion scripts start with a digit, so they are loaded by path
+    path = os.path.join(current_dir, VARIANTS[variant])
+    spec = importlib.util.spec_from_file_location("converter", path)
+    converter = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(converter)
+    return converter
+
+
+def prepare(args):
+    job = create_job_dir(args.job)
+    use_job_metrics(job)
+    converter = load_converter(args.variant)
+    converter.process_csv(
+        args.input_csv,
+        start_row=args.start_row,
+        end_row=args.end_row,
+        workers=args.workers or converter.ESTIMATE_WORKERS,
+        dedup=args.dedup,
+        fast_path=args.fast_path,
+        incremental=args.incremental,
+        open_shards=args.open_shards,
+        output_dir=job_dir(job),
+        manifest_path=manifest_path(job),
+        job=job,
+    )
+    print(f"Prepared {job} in {job_dir(job)}")
+
+
+def other_jobs_in_flight(job):
+    """{model: tokens} in flight for every other job; the enqueued-token limit is per organization."""
+    reserved = {}
+    for other, job_manifest in iter_jobs():
+        if other == job:
+            continue
+        for shard in job_manifest["shards"]:
+            if manifest.is_in_flight(shard):
+                reserved[shard.get("model")] = reserved.get(shard.get("model"), 0) + shard["estimated_tokens"]
+    return reserved
+
+
+def submit(args):
+    job = resolve_job(args.job)
+    use_job_metrics(job)
+    if args.realtime:
+        import realtime
+
+        asyncio.run(realtime.run(
+            manifest_path(job),
+            args.rpm or realtime.REQUESTS_PER_MINUTE,
+            args.tpm or realtime.TOKENS_PER_MINUTE,
+            args.concurrency or realtime.MAX_CONCURRENT_REQUESTS,
+        ))
+        return
+
+    import submitter
+
+    asyncio.run(submitter.submit_all(
+        manifest_path(job),
+        concurrency=args.concurrency or submitter.MAX_CONCURRENT_SUBMISSIONS,
+        token_budget=args.budget or submitter.ENQUEUED_TOKEN_BUDGET,
+        description=args.description or f"hear about classification ({job})",
+        reserved=other_jobs_in_flight(job),
+    ))
+
+
+async def poll_jobs(jobs, wait):
+    import poller
+    import submitter
+
+    client = submitter.make_async_client()
+    if wait:
+        await asyncio.gather(*(poller.run(manifest_path(job), client) for job in jobs))
+        return
+
+    async def poll_once(job):
+        path = manifest_path(job)
+        job_manifest = manifest.load(path)
+        base = manifest.snapshot(job_manifest)
+        shards = [shard for shard in job_manifest["shards"] if poller.needs_work(shard)]
+        await asyncio.gather(*(poller.poll_shard(client, shard, job) for shard in shards))
+        job_manifest = manifest.save_changes(job_manifest, base, path)
+        print(f"{job}: ", end="")
+        poller.print_progress(job_manifest)
+
+    await asyncio.gather(*(poll_once(job) for job in jobs))
+
+
+def poll(args):
+    if args.jobs:
+        jobs = [resolve_job(job) for job in args.jobs]
+    else:
+        # Every job with a batch still running or not downloaded yet
+        jobs = [job for job, job_manifest in iter_jobs()
+                if any(shard.get("batch_id") and not shard.get("downloaded") for shard in job_manifest["shards"])]
+    if not jobs:
+        print("No job is waiting on a batch")
+        return
+    for job in jobs:
+        use_job_metrics(job)
+    asyncio.run(poll_jobs(jobs, args.wait))
+
+
+def fetch(args):
+    import aggregate
+    import merge
+    import results
+
+    job = resolve_job(args.job)
+    instrumentation = use_job_metrics(job)
+    path = manifest_path(job)
+    retry_path = os.path.join(job_dir(job), "output_hear_about_retry.jsonl")
+
+    # Fetch every shard of the job concurrently and decode them into one deduplicated index
+    job_manifest = asyncio.run(aggregate.download_all(path))
+    decode_stats = results.new_stats()
+    index = aggregate.build_index(job_manifest, retry_path, decode_stats)
+    results.print_stats(decode_stats, retry_path)
+    usage_summary = aggregate.usage_summary(job_manifest, index)
+    aggregate.print_usage_summary(usage_summary, len(index))
+    aggregate.emit_usage_metrics(job, usage_summary)
+    instrumentation.emit_stages(decode_stats["timings"], job=job)
+
+    merge.merge_job(
+        index,
+        job_manifest.get("input_csv") or os.path.join(current_dir, "Input.csv"),
+        os.path.join(job_dir(job), f"output_hear_about.{args.format}"),
+        job_manifest,
+        fast_path_path=job_manifest.get("fast_path_path"),
+        dedup_map_path=job_manifest.get("dedup_map_path"),
+        output_format=args.format,
+        columns=args.columns,
+    )
+    prom_path = instrumentation.write_prometheus(instrumentation.JOB_METRICS[job], os.path.join(job_dir(job), "metrics.prom"))
+    print(f"Metrics saved to: {prom_path}")
+
+
+async def cancel_job(job, remote=False):
+    import batches
+    import submitter
+
+    client = submitter.make_async_client()
+    path = manifest_path(job)
+    job_manifest = manifest.load(path)
+    base = manifest.snapshot(job_manifest)
+    batch_ids = [shard["batch_id"] for shard in job_manifest["shards"] if manifest.is_in_flight(shard)]
+    if remote:
+        # Also catches batches created for the job but never recorded, e.g. after a crash mid-submit
+        found = batches.select(await batches.list_batches(client), job=job)
+        batch_ids += [batch["id"] for batch in found if batches.is_cancellable(batch) and batch["id"] not in batch_ids]
+
+    # Every batch of the job is cancelled at once, so a bad prompt stops spending immediately
+    statuses = await batches.cancel_batches(client, batch_ids)
+    for shard in job_manifest["shards"]:
+        if statuses.get(shard.get("batch_id")):
+            shard["status"] = statuses[shard["batch_id"]]
+    manifest.save_changes(job_manifest, base, path)
+    failed = sum(1 for status in statuses.values() if status is None)
+    print(f"Cancelled {len(statuses) - failed} in-flight batch(es) of {job}, {failed} failed")
+
+
+def cancel(args):
+    asyncio.run(cancel_job(resolve_job(args.job), args.remote))
+
+
+def list_jobs(args):
+    if args.remote:
+        import batches
+
+        selected, stats = asyncio.run(batches.list_selected(args))
+        batches.print_batches(selected)
+        batches.print_stats(stats)
+        return
+
+    jobs = list(iter_jobs())
+    if not jobs:
+        print(f"No jobs in {JOBS_DIR}")
+        return
+    for job, job_manifest in jobs:
+        statuses = {}
+        for shard in job_manifest["shards"]:
+            statuses[shard.get("status", "pending")] = statuses.get(shard.get("status", "pending"), 0) + 1
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(job_manifest.get("created_at", 0)))
+        lines = sum(shard["lines"] for shard in job_manifest["shards"])
+        print(f"{job:<28} {created}  {len(job_manifest['shards']):>3} shard(s) {lines:>10,} requests  "
+              + ", ".join(f"{status} {count}" for status, count in sorted(statuses.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    prepare_parser = commands.add_parser("prepare", help="shard an export into a new job")
+    prepare_parser.add_argument("input_csv")
+    prepare_parser.add_argument("--variant", choices=sorted(VARIANTS), default="hardcoded")
+    prepare_parser.add_argument("--job", default=None, help="job id (default: job_<timestamp>)")
+    prepare_parser.add_argument("--start-row", type=int, default=0)
+    prepare_parser.add_argument("--end-row", type=int, default=None)
+    prepare_parser.add_argument("--workers", type=int, default=None)
+    prepare_parser.add_argument("--dedup", action="store_true")
+    prepare_parser.add_argument("--fast-path", action="store_true")
+    prepare_parser.add_argument("--incremental", action="store_true")
+    prepare_parser.add_argument("--open-shards", type=int, default=1)
+    prepare_parser.set_defaults(handler=prepare)
+
+    submit_parser = commands.add_parser("submit", help="create batches (or run them in real time)")
+    submit_parser.add_argument("job", nargs="?")
+    submit_parser.add_argument("--budget", type=int, default=None, help="enqueued-token budget")
+    submit_parser.add_argument("--concurrency", type=int, default=None)
+    submit_parser.add_argument("--description", default=None)
+    submit_parser.add_argument("--realtime", action="store_true", help="send requests directly instead")
+    submit_parser.add_argument("--rpm", type=int, default=None, help="requests/min limit for --realtime")
+    submit_parser.add_argument("--tpm", type=int, default=None, help="tokens/min limit for --realtime")
+    submit_parser.set_defaults(handler=submit)
+
+    poll_parser = commands.add_parser("poll", help="refresh batch status and download finished results")
+    poll_parser.add_argument("jobs", nargs="*", help="default: every job waiting on a batch")
+    poll_parser.add_argument("--wait", action="store_true", help="keep polling until every batch is done")
+    poll_parser.set_defaults(handler=poll)
+
+    fetch_parser = commands.add_parser("fetch", help="decode results and merge them with the input")
+    fetch_parser.add_argument("job", nargs="?")
+    fetch_parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    fetch_parser.add_argument("--columns", nargs="+", default=None, help="input columns to keep")
+    fetch_parser.set_defaults(handler=fetch)
+
+    cancel_parser = commands.add_parser("cancel", help="cancel every in-flight batch of a job")
+    cancel_parser.add_argument("job", nargs="?")
+    cancel_parser.add_argument("--remote", action="store_true",
+                               help="also cancel unrecorded batches tagged with the job (lists every batch)")
+    cancel_parser.set_defaults(handler=cancel)
+
+    list_parser = commands.add_parser("list", help="list jobs and their shard statuses")
+    list_parser.add_argument("--remote", action="store_true", help="list the batches in the account instead")
+    # The same filters as batches.add_filter_arguments, repeated so `list` does not import openai
+    list_parser.add_argument("--status", nargs="+", default=None, help="with --remote: keep these statuses")
+    list_parser.add_argument("--metadata", nargs="+", default=None, metavar="KEY=VALUE",
+                             help="with --remote: keep batches with this metadata")
+    list_parser.add_argument("--job", default=None, help="with --remote: keep batches submitted for this job")
+    list_parser.add_argument("--refresh", action="store_true", help="with --remote: walk every page")
+    list_parser.set_defaults(handler=list_jobs)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Long-running poller for every batch in a job manifest.
+
+Each in-flight batch is polled on its own schedule: exponential backoff
+with jitter, starting from an interval scaled to the batch's size and
+reset whenever its progress changes. Batch state lives in the manifest.
+Output and error files are downloaded as soon as a batch completes, and
+overall progress (completed/failed requests, throughput, ETA) is printed
+after every round.
+
+    python poller.py --manifest batch_manifest.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+import httpx
+import openai
+
+import instrumentation
+import manifest
+import submitter
+
+MIN_POLL_SECONDS = 10
+MAX_POLL_SECONDS = 600
+SECONDS_PER_1000_LINES = 5  # bigger batches take longer, so start polling them less often
+BACKOFF_FACTOR = 1.5
+JITTER = 0.2
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+def base_interval(shard):
+    return min(MAX_POLL_SECONDS, max(MIN_POLL_SECONDS, shard.get("lines", 0) / 1000 * SECONDS_PER_1000_LINES))
+
+
+def next_interval(shard, unchanged_polls):
+    interval = min(MAX_POLL_SECONDS, base_interval(shard) * BACKOFF_FACTOR ** unchanged_polls)
+    return interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+def output_paths(shard):
+    stem = os.path.splitext(shard["path"])[0]
+    return f"{stem}_output.jsonl", f"{stem}_errors.jsonl"
+
+
+async def download_file(client, file_id, path):
+    """Stream a file to disk in chunks instead of holding it in memory."""
+    tmp_path = path + ".part"
+    try:
+        async with client.files.with_streaming_response.content(file_id) as response:
+            with open(tmp_path, "wb") as f:
+                async for chunk in response.iter_bytes(DOWNLOAD_CHUNK_BYTES):
+                    f.write(chunk)
+    except BaseException:
+        # Never leave a partial file behind; the whole download is retried
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return path
+
+
+async def download_results(client, shard):
+    output_path, error_path = output_paths(shard)
+    downloads = []
+    if shard.get("output_file_id"):
+        downloads.append(download_file(client, shard["output_file_id"], output_path))
+        shard["output_path"] = output_path
+    if shard.get("error_file_id"):
+        downloads.append(download_file(client, shard["error_file_id"], error_path))
+        shard["error_path"] = error_path
+    # Let both downloads finish or clean up before reporting the first failure
+    for result in await asyncio.gather(*downloads, return_exceptions=True):
+        if isinstance(result, BaseException):
+            raise result
+    shard["downloaded"] = True
+
+
+def apply_batch(shard, batch):
+    """Copy the fields we track from a retrieved batch; returns True if progress changed."""
+    request_counts = batch.request_counts.model_dump() if batch.request_counts else {}
+    changed = (batch.status, request_counts) != (shard.get("status"), shard.get("request_counts"))
+    shard["status"] = batch.status
+    shard["request_counts"] = request_counts
+    shard["created_at"] = batch.created_at
+    shard["in_progress_at"] = batch.in_progress_at
+    # When the batch reached its terminal status, whichever it was
+    shard["finished_at"] = batch.completed_at or batch.failed_at or batch.expired_at or batch.cancelled_at
+    shard["output_file_id"] = batch.output_file_id
+    shard["error_file_id"] = batch.error_file_id
+    if batch.usage:
+        shard["usage"] = batch.usage.model_dump()
+    return changed
+
+
+def progress(job_manifest, now=None):
+    now = now or time.time()
+    completed = failed = total = 0
+    started = []
+    for shard in job_manifest["shards"]:
+        counts = shard.get("request_counts") or {}
+        completed += counts.get("completed", 0)
+        failed += counts.get("failed", 0)
+        total += counts.get("total", 0) or shard.get("lines", 0)
+        if shard.get("in_progress_at"):
+            started.append(shard["in_progress_at"])
+
+    elapsed = now - min(started) if started else 0
+    throughput = (completed + failed) / elapsed if elapsed > 0 else 0.0
+    remaining = total - completed - failed
+    eta = remaining / throughput if throughput > 0 else None
+    return {"completed": completed, "failed": failed, "total": total,
+            "requests_per_sec": throughput, "eta_seconds": eta}
+
+
+def print_progress(job_manifest):
+    p = progress(job_manifest)
+    eta = f"{p['eta_seconds'] / 60:.1f} min" if p["eta_seconds"] is not None else "unknown"
+    print(f"Requests: {p['completed']:,} completed, {p['failed']:,} failed of {p['total']:,} | "
+          f"{p['requests_per_sec']:.1f} req/s | ETA {eta}")
+
+
+def needs_work(shard):
+    if not shard.get("batch_id"):
+        return False
+    return manifest.is_in_flight(shard) or (
+        shard.get("status") in manifest.TERMINAL_STATUSES and not shard.get("downloaded")
+    )
+
+
+def emit_batch_metrics(shard, job=None):
+    """Record how long a finished batch waited in the queue and how long it ran."""
+    labels = {"job": job, "shard": shard["index"], "model": shard.get("model"), "batch_id": shard["batch_id"]}
+    if shard.get("in_progress_at") and shard.get("created_at"):
+        instrumentation.emit_stage("queue_wait", shard["in_progress_at"] - shard["created_at"], **labels)
+    if shard.get("finished_at") and shard.get("in_progress_at"):
+        instrumentation.emit_stage("processing", shard["finished_at"] - shard["in_progress_at"], **labels)
+
+
+async def poll_shard(client, shard, job=None):
+    try:
+        batch = await client.batches.retrieve(shard["batch_id"])
+        changed = apply_batch(shard, batch)
+        if shard["status"] in manifest.TERMINAL_STATUSES and not shard.get("downloaded"):
+            with instrumentation.timed("download", job=job, shard=shard["index"]):
+                await download_results(client, shard)
+            emit_batch_metrics(shard, job)
+            print(f"Shard {shard['index']} {shard['status']}; results saved next to {shard['path']}")
+    except (openai.OpenAIError, httpx.HTTPError, OSError) as e:
+        # A transient API, transport or disk error only delays this batch; it is retried on its next backoff slot
+        print(f"Polling shard {shard['index']} failed: {e}")
+        return False
+    return changed
+
+
+async def run(manifest_path=manifest.MANIFEST_JSON, client=None):
+    """Poll until every submitted batch is terminal and its files are downloaded."""
+    client = client or submitter.make_async_client()
+    next_poll_at = {}
+    unchanged_polls = {}
+
+    while True:
+        job_manifest = manifest.load(manifest_path)
+        base = manifest.snapshot(job_manifest)
+        shards = [shard for shard in job_manifest["shards"] if needs_work(shard)]
+        if not shards:
+            print_progress(job_manifest)
+            print(f"All submitted batches of {job_manifest['job']} are finished")
+            return job_manifest
+
+        now = time.monotonic()
+        due = [shard for shard in shards if next_poll_at.get(shard["batch_id"], 0) <= now]
+        results = await asyncio.gather(*(poll_shard(client, shard, job_manifest["job"]) for shard in due))
+
+        for shard, changed in zip(due, results):
+            batch_id = shard["batch_id"]
+            unchanged_polls[batch_id] = 0 if changed else unchanged_polls.get(batch_id, 0) + 1
+            next_poll_at[batch_id] = now + next_interval(shard, unchanged_polls[batch_id])
+
+        manifest.save_changes(job_manifest, base, manifest_path)
+        if due:
+            print_progress(job_manifest)
+
+        waits = [next_poll_at[shard["batch_id"]] for shard in shards if shard["batch_id"] in next_poll_at]
+        await asyncio.sleep(max(0.0, min(waits, default=now) - time.monotonic()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--manifest", default=manifest.MANIFEST_JSON)
+    args = parser.parse_args()
+    asyncio.run(run(args.manifest))
+
+
+if __name__ == "__main__":
+    main()
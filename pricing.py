@@ -0,0 +1,46 @@
+"""Per-model token prices, the one place every cost calculation reads from.
+
+Prices are USD per million tokens for the Batch API (half the standard
+rate) and for standard requests, used by shards run with realtime.py.
+Dated snapshots such as "gpt-5-2025-08-07" match their model's prefix.
+"""
+
+#https://platform.openai.com/docs/pricing?latest-pricing=batch
+PRICES_PER_MILLION = {
+    "batch": {
+        "gpt-5": {"input": 0.625, "cached_input": 0.0625, "output": 5.0},
+        "gpt-5-mini": {"input": 0.125, "cached_input": 0.0125, "output": 1.0},
+        "gpt-5-nano": {"input": 0.025, "cached_input": 0.0025, "output": 0.2},
+    },
+    "standard": {
+        "gpt-5": {"input": 1.25, "cached_input": 0.125, "output": 10.0},
+        "gpt-5-mini": {"input": 0.25, "cached_input": 0.025, "output": 2.0},
+        "gpt-5-nano": {"input": 0.05, "cached_input": 0.005, "output": 0.4},
+    },
+}
+DEFAULT_MODEL = "gpt-5"  # used when a model is unknown or not recorded
+DEFAULT_TIER = "batch"
+
+
+def prices(model=None, tier=DEFAULT_TIER):
+    """Return {"input", "cached_input", "output"} per million tokens for a model."""
+    table = PRICES_PER_MILLION[tier]
+    if model in table:
+        return table[model]
+    # Longest matching prefix, so "gpt-5-mini-2025-08-07" is not priced as "gpt-5"
+    matches = [name for name in table if model and model.startswith(name)]
+    return table[max(matches, key=len)] if matches else table[DEFAULT_MODEL]
+
+
+def cost(input_tokens, output_tokens, cached_tokens=0, model=None, tier=DEFAULT_TIER):
+    """Cost in USD; cached input tokens are billed at the discounted rate."""
+    price = prices(model, tier)
+    return (
+        (input_tokens - cached_tokens) * price["input"]
+        + cached_tokens * price["cached_input"]
+        + output_tokens * price["output"]
+    ) / 1_000_000
+
+
+def shard_tier(shard):
+    return "standard" if shard.get("executor") == "realtime" else "batch"
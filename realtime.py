@@ -0,0 +1,209 @@
+"""Real-time fallback executor for small or urgent jobs.
+
+Instead of creating a batch with a 24h completion window, every request in
+the job's pending shards is sent straight to /v1/responses with AsyncOpenAI.
+Concurrency is capped, and requests are paced by token buckets for the
+org's requests/min and tokens/min limits (using each shard's token
+estimate, corrected by actual usage as responses arrive). Responses are
+written to the same <shard>_output.jsonl / <shard>_errors.jsonl files, in
+the same line format, that the poller downloads for a batch, and the shard
+is marked completed and downloaded in the manifest, so 4_get_batch.py and
+reconcile.py consume them unchanged.
+
+The client honours OPENAI_BASE_URL, so this can run against a local mock
+server (see benchmarks/).
+
+    python realtime.py --manifest batch_manifest.json --rpm 500 --tpm 500000
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+import openai
+
+import instrumentation
+import manifest
+import poller
+import reconcile
+import submitter
+
+REQUESTS_PER_MINUTE = 500  # from https://platform.openai.com/settings/organization/limits
+TOKENS_PER_MINUTE = 500000
+MAX_CONCURRENT_REQUESTS = 32
+MAX_RETRIES = 5  # the client retries 429s and 5xx with backoff before a row is written as failed
+
+
+class RateLimiter:
+    """Token buckets for requests/min and tokens/min, refilled continuously."""
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+        self.capacity = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.available = dict(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        for kind, capacity in self.capacity.items():
+            self.available[kind] = min(capacity, self.available[kind] + elapsed * capacity / 60)
+
+    async def acquire(self, tokens):
+        # A request larger than the whole bucket waits for a full bucket instead of forever
+        tokens = min(tokens, self.capacity["tokens"])
+        # Waiting while holding the lock keeps requests in arrival order
+        async with self.lock:
+            while True:
+                self.refill()
+                wait = max(
+                    (needed - self.available[kind]) * 60 / self.capacity[kind]
+                    for kind, needed in (("requests", 1), ("tokens", tokens))
+                )
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.available["requests"] -= 1
+            self.available["tokens"] -= tokens
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """Give back (or take) the difference between a request's estimate and its actual usage."""
+        self.available["tokens"] = min(self.capacity["tokens"], self.available["tokens"] + estimated_tokens - actual_tokens)
+
+
+def new_usage():
+    return {
+        "input_tokens": 0,
+        "input_tokens_details": {"cached_tokens": 0},
+        "output_tokens": 0,
+        "output_tokens_details": {"reasoning_tokens": 0},
+        "total_tokens": 0,
+    }
+
+
+def add_usage(total, usage):
+    total["input_tokens"] += usage.get("input_tokens", 0)
+    total["input_tokens_details"]["cached_tokens"] += (usage.get("input_tokens_details") or {}).get("cached_tokens", 0)
+    total["output_tokens"] += usage.get("output_tokens", 0)
+    total["output_tokens_details"]["reasoning_tokens"] += (usage.get("output_tokens_details") or {}).get("reasoning_tokens", 0)
+    total["total_tokens"] += usage.get("total_tokens", 0)
+
+
+def output_line(entry, status_code=None, request_id=None, body=None, error=None):
+    """One line in the batch output/error file format."""
+    return {
+        "id": f"realtime_req_{uuid.uuid4().hex}",
+        "custom_id": entry["custom_id"],
+        "response": None if status_code is None else {"status_code": status_code, "request_id": request_id, "body": body},
+        "error": error,
+    }
+
+
+async def send_request(client, entry, limiter, estimated_tokens):
+    """Send one batch input line as a regular request; returns its batch output line."""
+    await limiter.acquire(estimated_tokens)
+    try:
+        # cast_to=httpx.Response keeps the raw JSON body exactly as a batch would return it
+        response = await client.post(entry["url"].removeprefix("/v1"), body=entry["body"], cast_to=httpx.Response)
+    except openai.APIStatusError as e:
+        limiter.settle(estimated_tokens, 0)
+        return output_line(entry, e.status_code, e.response.headers.get("x-request-id"), {"error": e.body})
+    except openai.APIConnectionError as e:
+        limiter.settle(estimated_tokens, 0)
+        return output_line(entry, error={"code": "connection_error", "message": str(e)})
+
+    try:
+        body = response.json()
+    except ValueError as e:
+        limiter.settle(estimated_tokens, 0)
+        return output_line(entry, error={"code": "invalid_response", "message": str(e)})
+    limiter.settle(estimated_tokens, (body.get("usage") or {}).get("total_tokens", estimated_tokens))
+    return output_line(entry, response.status_code, response.headers.get("x-request-id"), body)
+
+
+async def run_shard(client, shard, limiter, semaphore, job=None):
+    """Execute every line of a shard, writing batch-format output and error files."""
+    tokens_per_line = shard["estimated_tokens"] / max(shard["lines"], 1)
+    output_path, error_path = poller.output_paths(shard)
+    counts = {"total": 0, "completed": 0, "failed": 0}
+    usage = new_usage()
+    started = time.time()
+    pending = set()
+
+    with open(output_path, "w", encoding="utf-8") as output_file, open(error_path, "w", encoding="utf-8") as error_file:
+        async def execute(entry):
+            try:
+                line = await send_request(client, entry, limiter, tokens_per_line)
+            finally:
+                semaphore.release()
+            ok = (line["response"] or {}).get("status_code") == 200
+            counts["completed" if ok else "failed"] += 1
+            if ok:
+                add_usage(usage, line["response"]["body"].get("usage") or {})
+            # Like a batch, only successful responses go to the output file
+            (output_file if ok else error_file).write(json.dumps(line, ensure_ascii=False) + "\n")
+
+        # Lines are read lazily; the semaphore bounds how many are in flight at once
+        for entry in reconcile.iter_entries(shard["path"]):
+            await semaphore.acquire()
+            counts["total"] += 1
+            task = asyncio.create_task(execute(entry))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        await asyncio.gather(*pending)
+
+    shard.update(
+        executor="realtime",
+        status="completed",
+        request_counts=counts,
+        in_progress_at=int(started),
+        usage=usage,
+        output_path=output_path,
+        error_path=error_path,
+        downloaded=True,
+    )
+    elapsed = time.time() - started
+    instrumentation.emit_stage("processing", elapsed, job=job, shard=shard["index"], model=shard.get("model"),
+                               executor="realtime")
+    print(f"Shard {shard['index']}: {counts['completed']:,} completed, {counts['failed']:,} failed "
+          f"in {elapsed:.1f}s ({counts['total'] / elapsed if elapsed > 0 else 0.0:,.1f} requests/sec)")
+    return shard
+
+
+async def run(manifest_path=manifest.MANIFEST_JSON, requests_per_minute=REQUESTS_PER_MINUTE,
+              tokens_per_minute=TOKENS_PER_MINUTE, concurrency=MAX_CONCURRENT_REQUESTS, client=None):
+    """Execute every shard not yet submitted as a batch; returns the executed shards."""
+    client = (client or submitter.make_async_client()).with_options(max_retries=MAX_RETRIES)
+    job_manifest = manifest.load(manifest_path)
+    base = manifest.snapshot(job_manifest)
+    shards = [shard for shard in job_manifest["shards"] if not shard.get("batch_id") and not shard.get("downloaded")]
+    print(f"Running {len(shards)} shard(s) of {job_manifest['job']} in real time "
+          f"({requests_per_minute:,} requests/min, {tokens_per_minute:,} tokens/min)")
+
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [asyncio.create_task(run_shard(client, shard, limiter, semaphore, job_manifest["job"]))
+             for shard in shards]
+    # Persist after every shard so a crash never loses finished results
+    for task in asyncio.as_completed(tasks):
+        await task
+        manifest.save_changes(job_manifest, base, manifest_path)
+        base = manifest.snapshot(job_manifest)
+    return shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--manifest", default=manifest.MANIFEST_JSON)
+    parser.add_argument("--rpm", type=int, default=REQUESTS_PER_MINUTE, help="requests per minute limit")
+    parser.add_argument("--tpm", type=int, default=TOKENS_PER_MINUTE, help="tokens per minute limit")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_REQUESTS)
+    args = parser.parse_args()
+    asyncio.run(run(args.manifest, args.rpm, args.tpm, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Rebuild a minimal retry shard from the rows a finished job did not classify.
+
+Every custom_id submitted by the job's shards is compared with the
+downloaded output and error files. Rows that are missing, failed, or came
+back truncated or undecodable are copied from the original shards into new
+retry shards (optionally with a higher max_output_tokens), packed within
+the same token, line and byte limits as the job's shards. They are added
+to the manifest and can be submitted straight away. A 1% failure rate then
+costs a 1% rerun.
+
+    python reconcile.py --max-output-tokens 200 --submit
+"""
+import argparse
+import asyncio
+import json
+import os
+
+import manifest
+import results
+import sharder
+import submitter
+
+
+def iter_entries(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def is_finished(shard):
+    if shard.get("status") not in manifest.TERMINAL_STATUSES:
+        return False
+    # A shard given up on before it got a batch (submitter.MAX_SUBMIT_ATTEMPTS) has nothing to
+    # download; find_unfinished reports all of its rows as missing
+    return bool(shard.get("downloaded") or not shard.get("batch_id"))
+
+
+def find_unfinished(job_manifest):
+    """Return ({custom_id: reason} for rows needing a retry, stats) across all shards."""
+    succeeded = set()
+    reasons = {}
+    stats = results.new_stats()
+    for shard in job_manifest["shards"]:
+        for path in (shard.get("output_path"), shard.get("error_path")):
+            if not path or not os.path.exists(path):
+                continue
+            for custom_id, record, error in results.iter_outcomes(path, stats):
+                if record is not None:
+                    succeeded.add(custom_id)
+                elif custom_id is not None:
+                    reasons[custom_id] = error.reason
+
+    unfinished = {}
+    for shard in job_manifest["shards"]:
+        for entry in iter_entries(shard["path"]):
+            custom_id = entry["custom_id"]
+            if custom_id not in succeeded:
+                unfinished[custom_id] = reasons.get(custom_id, "missing")
+    return unfinished, stats
+
+
+def shard_limits(job_manifest):
+    """The packing limits recorded by the converter, or the converter's own for older manifests."""
+    if job_manifest.get("limits"):
+        return job_manifest["limits"]
+    import pipeline
+
+    converter = pipeline.load_converter("hardcoded")
+    return {
+        "max_tokens_per_batch": int(converter.MAX_TOKENS_PER_BATCH * (1 - converter.TOKEN_SAFETY_MARGIN)),
+        "max_lines_per_batch": converter.MAX_LINES_PER_BATCH,
+        "max_bytes_per_batch": converter.MAX_BYTES_PER_BATCH,
+    }
+
+
+def iter_retry_entries(job_manifest, unfinished, estimates, max_output_tokens=None):
+    """Yield each unfinished entry once, recording its estimated tokens in estimates."""
+    for shard in job_manifest["shards"]:
+        tokens_per_line = shard["estimated_tokens"] / max(shard["lines"], 1)
+        for entry in iter_entries(shard["path"]):
+            custom_id = entry["custom_id"]
+            if custom_id not in unfinished or custom_id in estimates:
+                continue
+            line_tokens = tokens_per_line
+            if max_output_tokens:
+                line_tokens += max_output_tokens - entry["body"].get("max_output_tokens", 0)
+                entry["body"]["max_output_tokens"] = max_output_tokens
+            estimates[custom_id] = line_tokens
+            yield entry
+
+
+def plain_serializer(sample_entry):
+    # Entries from earlier retry rounds can differ in more than custom_id and input
+    return lambda json_entry: json.dumps(json_entry, ensure_ascii=False) + '\n'
+
+
+def write_retry_shards(job_manifest, unfinished, max_output_tokens=None):
+    """Pack unfinished entries from the original shards into new shards; returns their manifest entries."""
+    retry_round = 1 + max((shard.get("retry_round", 1 if shard.get("retry_of") else 0)
+                           for shard in job_manifest["shards"]), default=0)
+    first_index = len(job_manifest["shards"])
+    output_dir = os.path.dirname(job_manifest["shards"][0]["path"])
+    limits = shard_limits(job_manifest)
+
+    estimates = {}
+    _, shards = sharder.shard_rows(
+        iter_retry_entries(job_manifest, unfinished, estimates, max_output_tokens),
+        lambda entry: entry,
+        lambda json_entries: [estimates[entry["custom_id"]] for entry in json_entries],
+        lambda index: os.path.join(output_dir, f"{job_manifest['job']}_retry_{retry_round}_{index}.jsonl"),
+        limits["max_tokens_per_batch"],
+        limits["max_lines_per_batch"],
+        max_bytes_per_batch=limits["max_bytes_per_batch"],
+        make_serializer=plain_serializer,
+    )
+
+    retry_of = sorted({shard["index"] for shard in job_manifest["shards"]})
+    return [
+        dict(
+            shard,
+            index=first_index + shard["index"],
+            estimated_tokens=int(shard["estimated_tokens"]),
+            model=job_manifest["shards"][0].get("model"),
+            status="pending",
+            retry_of=retry_of,
+            retry_round=retry_round,
+        )
+        for shard in shards
+    ]
+
+
+def reconcile(manifest_path=manifest.MANIFEST_JSON, max_output_tokens=None):
+    """Add retry shards for unfinished rows to the manifest; returns them (empty if nothing to retry)."""
+    job_manifest = manifest.load(manifest_path)
+    base = manifest.snapshot(job_manifest)
+    waiting = [shard["index"] for shard in job_manifest["shards"] if not is_finished(shard)]
+    if waiting:
+        raise RuntimeError(f"Shards {waiting} are not finished and downloaded yet; run poller.py first")
+
+    unfinished, stats = find_unfinished(job_manifest)
+    results.print_stats(stats)
+    if not unfinished:
+        print("Every submitted row has a valid result; nothing to retry")
+        return []
+
+    by_reason = {}
+    for reason in unfinished.values():
+        by_reason[reason] = by_reason.get(reason, 0) + 1
+    print(f"{len(unfinished):,} row(s) need a retry: "
+          + ", ".join(f"{reason} {count:,}" for reason, count in sorted(by_reason.items())))
+
+    retry_shards = write_retry_shards(job_manifest, unfinished, max_output_tokens)
+    job_manifest["shards"].extend(retry_shards)
+    manifest.save_changes(job_manifest, base, manifest_path)
+    print(f"{len(retry_shards)} retry shard(s) of up to {max(shard['lines'] for shard in retry_shards):,} rows "
+          f"saved to: {os.path.dirname(retry_shards[0]['path'])}")
+    return retry_shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--manifest", default=manifest.MANIFEST_JSON)
+    parser.add_argument("--max-output-tokens", type=int, default=None,
+                        help="raise the output cap for retried rows (e.g. after truncation)")
+    parser.add_argument("--submit", action="store_true", help="submit the retry shards right away")
+    args = parser.parse_args()
+
+    retry_shards = reconcile(args.manifest, args.max_output_tokens)
+    if retry_shards and args.submit:
+        asyncio.run(submitter.submit_all(args.manifest, description="retry of failed rows"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Streaming download, parsing and decoding of batch output files.
+
+Output files can be hundreds of MB. They are streamed to disk in chunks
+and then read back one line at a time with jiter (the fast JSON parser
+already installed with openai), so only one line is decoded at a time
+instead of holding the text, the split lines and the parsed list at once.
+
+Each model answer is decoded as JSON and validated against the same
+JSON_SCHEMA the requests ask for. Lines that fail (request errors,
+non-200 responses, truncated or missing messages, invalid JSON, schema
+violations) are written to a retry file instead of aborting the run.
+"""
+import json
+import time
+
+import jiter
+
+import pricing
+from schema import validation_error
+
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+def cached_tokens(usage):
+    """Input tokens served from the prompt cache, from a response or batch usage dict."""
+    return (usage.get("input_tokens_details") or {}).get("cached_tokens", 0)
+
+
+def download_to_file(client, file_id, path):
+    with client.files.with_streaming_response.content(file_id) as response:
+        with open(path, "wb") as f:
+            for chunk in response.iter_bytes(DOWNLOAD_CHUNK_BYTES):
+                f.write(chunk)
+    return path
+
+
+class DecodeError(Exception):
+    def __init__(self, reason, detail=""):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+        self.detail = detail
+
+
+def new_stats():
+    return {"records": 0, "failures": {}, "timings": {"parse": 0.0, "decode": 0.0, "validate": 0.0}}
+
+
+def message_text(item):
+    if item.get("error"):
+        raise DecodeError("request_error", json.dumps(item["error"]))
+
+    response = item.get("response") or {}
+    if response.get("status_code") != 200:
+        raise DecodeError("http_error", str(response.get("status_code")))
+
+    response_body = response.get("body") or {}
+    if response_body.get("status") == "incomplete":
+        # Usually max_output_tokens was hit before the JSON answer was finished
+        reason = (response_body.get("incomplete_details") or {}).get("reason", "")
+        raise DecodeError("incomplete", reason)
+
+    # Find the message output (skip reasoning outputs)
+    for output_item in response_body.get("output") or []:
+        if output_item.get("type") == "message" and output_item.get("content"):
+            return output_item["content"][0].get("text", "")
+    raise DecodeError("missing_message")
+
+
+def record_from_output(item, timings=None, tier=pricing.DEFAULT_TIER):
+    """Build the output record for one batch output line, or raise DecodeError."""
+    timings = timings if timings is not None else new_stats()["timings"]
+
+    started = time.perf_counter()
+    content = message_text(item)
+    try:
+        parsed = jiter.from_json(content.encode("utf-8"))
+    except ValueError as e:
+        raise DecodeError("invalid_json", str(e))
+    decoded = time.perf_counter()
+    timings["decode"] += decoded - started
+
+    error = validation_error(parsed)
+    timings["validate"] += time.perf_counter() - decoded
+    if error:
+        raise DecodeError("schema_violation", error)
+
+    # Extract token usage if available
+    usage = item["response"]["body"].get("usage", {})
+    prompt_tokens = usage.get("input_tokens", 0)
+    completion_tokens = usage.get("output_tokens", 0)
+    total_tokens = usage.get("total_tokens", 0)
+    cached_prompt_tokens = cached_tokens(usage)
+
+    # Priced per model from pricing.py, with the cached-input discount
+    total_cost = pricing.cost(prompt_tokens, completion_tokens, cached_prompt_tokens,
+                              model=item["response"]["body"].get("model"), tier=tier)
+
+    return {
+        "custom_id": item.get("custom_id"),
+        "hear_source": parsed["hear_source"],
+        "hear_source_detail": parsed["hear_source_detail"],
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": total_tokens,
+        "cost_usd": round(total_cost, 6)
+    }
+
+
+def iter_outcomes(path, stats=None, tier=pricing.DEFAULT_TIER):
+    """Yield (custom_id, record, error) per line; exactly one of record/error is set."""
+    stats = stats if stats is not None else new_stats()
+    timings = stats["timings"]
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            started = time.perf_counter()
+            try:
+                item = jiter.from_json(line)
+            except ValueError as e:
+                timings["parse"] += time.perf_counter() - started
+                stats["failures"]["invalid_line"] = stats["failures"].get("invalid_line", 0) + 1
+                yield None, None, DecodeError("invalid_line", str(e))
+                continue
+            timings["parse"] += time.perf_counter() - started
+
+            try:
+                record = record_from_output(item, timings, tier)
+            except DecodeError as e:
+                stats["failures"][e.reason] = stats["failures"].get(e.reason, 0) + 1
+                yield item.get("custom_id"), None, e
+                continue
+            stats["records"] += 1
+            yield record["custom_id"], record, None
+
+
+def iter_records(path, retry_path=None, stats=None):
+    """Yield a record per decodable line; failures go to retry_path as JSON lines."""
+    retry_file = open(retry_path, "w", encoding="utf-8") if retry_path else None
+    try:
+        for custom_id, record, error in iter_outcomes(path, stats):
+            if record is not None:
+                yield record
+            elif retry_file:
+                retry_file.write(json.dumps(
+                    {"custom_id": custom_id, "reason": error.reason, "detail": error.detail}
+                ) + "\n")
+    finally:
+        if retry_file:
+            retry_file.close()
+
+
+def print_stats(stats, retry_path=None):
+    failed = sum(stats["failures"].values())
+    print(f"Decoded {stats['records']:,} records, {failed:,} failed")
+    for reason, count in sorted(stats["failures"].items()):
+        print(f"  {reason}: {count:,}")
+    if failed and retry_path:
+        print(f"Failed custom_ids saved to: {retry_path}")
+    timings = stats["timings"]
+    print(f"Timings: parse {timings['parse']:.2f}s, decode {timings['decode']:.2f}s, "
+          f"validate {timings['validate']:.2f}s")
@@ -0,0 +1,96 @@
+"""Local store of every classification made so far, for incremental runs.
+
+Results are keyed by lead id, a hash of the normalized how_hear answer and
+the prompt version (model + prompt fingerprint, see calibration.variant_key).
+With process_csv(incremental=True) the sharder skips rows whose current
+answer was already classified under the same prompt, and 4_get_batch.py
+upserts every new result, so daily exports only pay for the delta.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+import sharder
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DB = os.path.join(current_dir, "results_store.sqlite")
+SQLITE_MAX_PARAMS = 500
+
+RESULT_FIELDS = [
+    "hear_source",
+    "hear_source_detail",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+    "cost_usd",
+]
+
+
+def input_hash(text):
+    return hashlib.sha1(sharder.normalize_input(text).encode("utf-8")).hexdigest()
+
+
+class ResultsStore:
+    def __init__(self, path=RESULTS_DB):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "id TEXT PRIMARY KEY, input_hash TEXT NOT NULL, prompt_version TEXT NOT NULL, "
+            "hear_source TEXT, hear_source_detail TEXT, prompt_tokens INTEGER, completion_tokens INTEGER, "
+            "total_tokens INTEGER, cost_usd REAL, updated_at INTEGER)"
+        )
+
+    def classified_ids(self, rows, prompt_version):
+        """Return the ids among rows whose current answer is already stored for prompt_version."""
+        wanted = {row[sharder.ID_COLUMN]: input_hash(row[sharder.INPUT_COLUMN]) for row in rows}
+        ids = list(wanted)
+        found = set()
+        for start in range(0, len(ids), SQLITE_MAX_PARAMS):
+            chunk = ids[start:start + SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            for row_id, row_hash in self.conn.execute(
+                f"SELECT id, input_hash FROM results WHERE prompt_version = ? AND id IN ({placeholders})",
+                [prompt_version, *chunk],
+            ):
+                if wanted[row_id] == row_hash:
+                    found.add(row_id)
+        return found
+
+    def upsert(self, rows, prompt_version):
+        """Insert or replace results; each row needs id, how_hear and the RESULT_FIELDS."""
+        now = int(time.time())
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO results (id, input_hash, prompt_version, "
+            + ", ".join(RESULT_FIELDS) + ", updated_at) VALUES (" + ", ".join("?" * (len(RESULT_FIELDS) + 4)) + ")",
+            (
+                (str(row[sharder.ID_COLUMN]), input_hash(row[sharder.INPUT_COLUMN]), prompt_version,
+                 *(row[field] for field in RESULT_FIELDS), now)
+                for row in rows
+            ),
+        )
+        self.conn.commit()
+
+    def lookup(self, rows, prompt_version):
+        """Return {id: result fields} for rows whose current answer is stored for prompt_version.
+
+        A lead whose answer changed keeps no result until the new answer is
+        classified, rather than showing the classification of the old one.
+        """
+        wanted = {row[sharder.ID_COLUMN]: input_hash(row[sharder.INPUT_COLUMN]) for row in rows}
+        ids = list(wanted)
+        found = {}
+        for start in range(0, len(ids), SQLITE_MAX_PARAMS):
+            chunk = ids[start:start + SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            for row in self.conn.execute(
+                "SELECT id, input_hash, " + ", ".join(RESULT_FIELDS)
+                + f" FROM results WHERE prompt_version = ? AND id IN ({placeholders})",
+                [prompt_version, *chunk],
+            ):
+                if wanted[row[0]] == row[1]:
+                    found[row[0]] = dict(zip(RESULT_FIELDS, row[2:]))
+        return found
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,174 @@
+"""Local fast path for "How did you hear about Telnyx?" answers.
+
+Most answers are a single canonical alias from the PROMPT in
+1b_csv_to_jsonl_hardcoded_prompt.py ("Google", "asked ChatGPT", "a friend").
+Those are classified here with one regex pass and a dict lookup; anything
+ambiguous (ad cues, several platforms, free text) returns None and goes to
+the batch as before.
+
+Run directly to measure coverage and agreement against a merged output from
+a sample sent entirely to the LLM (i.e. produced without fast_path):
+    python rules.py output_hear_about.csv
+"""
+import csv
+import re
+import sys
+
+# Same columns as the records 4_get_batch.py builds from batch output
+FAST_PATH_FIELDS = [
+    "custom_id",
+    "hear_source",
+    "hear_source_detail",
+    "prompt_tokens",
+    "cached_tokens",
+    "completion_tokens",
+    "total_tokens",
+    "cost_usd",
+]
+
+SEARCH_ENGINES = {
+    "google": "Google",
+    "bing": "Bing",
+    "yahoo": "Yahoo",
+    "duckduckgo": "DuckDuckGo",
+    "duck duck go": "DuckDuckGo",
+    "aol": "AOL",
+    "baidu": "Baidu",
+}
+
+SOCIAL_PLATFORMS = {
+    "reddit": "Reddit",
+    "twitter": "X",
+    "linkedin": "LinkedIn",
+    "facebook": "Facebook",
+    "instagram": "Instagram",
+    "youtube": "YouTube",
+    "tiktok": "TikTok",
+    "discord": "Discord",
+    "telegram": "Telegram",
+    "twitch": "Twitch",
+}
+
+AI_TOOLS = {
+    "chatgpt": "ChatGPT",
+    "chat gpt": "ChatGPT",
+    "claude": "Claude",
+    "gemini": "Gemini",
+    "copilot": "Copilot",
+    "perplexity": "Perplexity",
+    "grok": "Grok",
+    "deepseek": "DeepSeek",
+    "phind": "Phind",
+    "meta ai": "Meta AI",
+}
+
+REFERRAL_SITES = {
+    "g2": "G2",
+    "capterra": "Capterra",
+    "getapp": "GetApp",
+    "alternativeto": "AlternativeTo",
+    "stackshare": "StackShare",
+    "github": "GitHub",
+    "stack overflow": "Stack Overflow",
+    "stackoverflow": "Stack Overflow",
+    "hacker news": "Hacker News",
+    "product hunt": "Product Hunt",
+    "quora": "Quora",
+}
+
+WORD_OF_MOUTH = ["friend", "friends", "colleague", "colleagues", "coworker", "coworkers",
+                 "co worker", "word of mouth"]
+
+OFFLINE_MEDIA = ["tv", "television", "radio", "newspaper", "podcast"]
+
+
+def build_aliases():
+    aliases = {}
+    for alias, detail in SEARCH_ENGINES.items():
+        aliases[alias] = ("Organic - Search", detail)
+    for alias, detail in SOCIAL_PLATFORMS.items():
+        aliases[alias] = ("Organic - Social", detail)
+    for alias, detail in AI_TOOLS.items():
+        aliases[alias] = ("Organic - AI", detail)
+    for alias, detail in REFERRAL_SITES.items():
+        aliases[alias] = ("Referral - General", detail)
+    for alias in WORD_OF_MOUTH:
+        aliases[alias] = ("Referral - WOM", "")
+    for alias in OFFLINE_MEDIA:
+        aliases[alias] = ("Unknown", "")
+    aliases["telnyx blog"] = ("Inbound", "Blog")
+    return aliases
+
+
+ALIASES = build_aliases()
+
+# Words that carry no channel signal. Paid cues ("ad", "sponsored", ...) are
+# deliberately absent so "google ads" never reduces to "google".
+FILLER_RE = re.compile(
+    r"\b(?:i|we|me|my|our|a|an|the|you|your|us|it|found|find|heard|saw|seen|on|in|via|from|"
+    r"through|thru|by|using|used|asked|told|recommended|search|searching|searched)\b"
+)
+NON_WORD_RE = re.compile(r"[^\w\s]+")
+MEANINGLESS_RE = re.compile(r"[\d\W_]*")
+
+
+def classify(text):
+    """Return (hear_source, hear_source_detail) for unambiguous answers, else None."""
+    text = "" if text is None else str(text).strip()
+
+    normalized = NON_WORD_RE.sub(" ", text.casefold().replace("-", " "))
+    residual = " ".join(FILLER_RE.sub(" ", normalized).split())
+    # Aliases win over the length check, so a bare "G2" is a referral like "via G2"
+    if residual in ALIASES:
+        return ALIASES[residual]
+
+    # Garbage/empty/ultra-short, numeric-only or punctuation-only answers are Unknown per the prompt
+    if len(text) < 3 or MEANINGLESS_RE.fullmatch(text):
+        return ("Unknown", "")
+    return None
+
+
+def fast_path_record(custom_id, classification):
+    hear_source, hear_source_detail = classification
+    return {
+        "custom_id": custom_id,
+        "hear_source": hear_source,
+        "hear_source_detail": hear_source_detail,
+        "prompt_tokens": 0,
+        "cached_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "cost_usd": 0.0,
+    }
+
+
+def compare_with_llm(merged_csv):
+    """Report fast-path coverage and agreement with LLM labels in a merged output CSV."""
+    total = covered = source_agree = exact_agree = 0
+    disagreements = []
+    with open(merged_csv, newline='', encoding='utf-8') as csvfile:
+        for row in csv.DictReader(csvfile):
+            total += 1
+            classification = classify(row["how_hear"])
+            if classification is None:
+                continue
+            covered += 1
+            llm = (row["hear_source"], row["hear_source_detail"] or "")
+            if classification[0] == llm[0]:
+                source_agree += 1
+            if classification == llm:
+                exact_agree += 1
+            elif len(disagreements) < 20:
+                disagreements.append((row["how_hear"], classification, llm))
+
+    print(f"Rows: {total:,}")
+    print(f"Short-circuited locally: {covered:,} ({covered / total:.1%})" if total else "No rows")
+    if covered:
+        print(f"hear_source agreement with LLM: {source_agree / covered:.1%}")
+        print(f"Exact (source + detail) agreement with LLM: {exact_agree / covered:.1%}")
+    for how_hear, local, llm in disagreements:
+        print(f"  {how_hear!r}: local={local} llm={llm}")
+
+
+if __name__ == "__main__":
+    compare_with_llm(sys.argv[1] if len(sys.argv) > 1 else "output_hear_about.csv")
@@ -0,0 +1,95 @@
+"""Keep the batch queue saturated without exceeding the enqueued-token limit.
+
+Submitting every shard of a large export at once makes the ones beyond the
+org's enqueued-token limit fail validation. This daemon tracks the
+estimated tokens of this job's in-flight batches per model and submits the
+next shards as soon as earlier batches finish and free up budget. It runs
+until every shard in the manifest has a batch or has failed to submit
+submitter.MAX_SUBMIT_ATTEMPTS times.
+
+    python scheduler.py --token-budget 1500000 --interval 30
+"""
+import argparse
+import asyncio
+
+import openai
+
+import manifest
+import submitter
+
+POLL_INTERVAL_SECONDS = 30
+
+# Batch error codes that mean "queue was full", so the shard can simply be resubmitted later
+REQUEUE_ERROR_CODES = {"token_limit_exceeded"}
+
+
+def should_requeue(batch):
+    errors = getattr(batch, "errors", None)
+    data = getattr(errors, "data", None) or []
+    return batch.status == "failed" and any(error.code in REQUEUE_ERROR_CODES for error in data)
+
+
+async def refresh_in_flight(client, job_manifest):
+    """Update the status of every in-flight batch, requeueing shards rejected for budget."""
+    shards = [shard for shard in job_manifest["shards"] if manifest.is_in_flight(shard)]
+
+    async def retrieve(shard):
+        try:
+            return await client.batches.retrieve(shard["batch_id"])
+        except openai.OpenAIError as e:
+            # A transient API error leaves the shard's status as it was until the next pass
+            print(f"Refreshing shard {shard['index']} failed: {e}")
+            return None
+
+    batches = await asyncio.gather(*(retrieve(shard) for shard in shards))
+    for shard, batch in zip(shards, batches):
+        if batch is None:
+            continue
+        if should_requeue(batch):
+            print(f"Shard {shard['index']} was rejected by the enqueued-token limit; requeueing")
+            shard.update(status="pending", batch_id=None, input_file_id=None)
+        else:
+            shard["status"] = batch.status
+
+
+async def run(manifest_path=manifest.MANIFEST_JSON, token_budget=submitter.ENQUEUED_TOKEN_BUDGET,
+              concurrency=submitter.MAX_CONCURRENT_SUBMISSIONS, interval=POLL_INTERVAL_SECONDS,
+              description="", client=None):
+    client = client or submitter.make_async_client()
+
+    while True:
+        job_manifest = manifest.load(manifest_path)
+        base = manifest.snapshot(job_manifest)
+        await refresh_in_flight(client, job_manifest)
+        job_manifest = manifest.save_changes(job_manifest, base, manifest_path)
+
+        pending = [shard for shard in job_manifest["shards"] if manifest.is_pending(shard)]
+        if not pending:
+            failed = sum(1 for shard in job_manifest["shards"] if shard.get("status") == "failed" and not shard.get("batch_id"))
+            print(f"All {len(job_manifest['shards'])} shard(s) of {job_manifest['job']} are submitted"
+                  + (f" ({failed} gave up after {submitter.MAX_SUBMIT_ATTEMPTS} failed attempts)" if failed else ""))
+            return job_manifest
+
+        shards = submitter.select_within_budget(job_manifest, token_budget)
+        if shards:
+            await submitter.submit_shards(client, job_manifest, shards, manifest_path, concurrency, description)
+
+        print(f"In flight: {manifest.in_flight_tokens(job_manifest):,} est. tokens, "
+              f"{len(pending) - len(shards)} shard(s) waiting for budget")
+        await asyncio.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--manifest", default=manifest.MANIFEST_JSON)
+    parser.add_argument("--token-budget", type=int, default=submitter.ENQUEUED_TOKEN_BUDGET,
+                        help="enqueued tokens allowed in flight per model")
+    parser.add_argument("--concurrency", type=int, default=submitter.MAX_CONCURRENT_SUBMISSIONS)
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL_SECONDS,
+                        help="seconds between status checks")
+    args = parser.parse_args()
+    asyncio.run(run(args.manifest, args.token_budget, args.concurrency, args.interval))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Structured-output schema for the hear-source classifier and a validator for it.
+
+1b_csv_to_jsonl_hardcoded_prompt.py sends JSON_SCHEMA as the strict
+json_schema response format, and results.py validates every returned
+message against the same schema.
+"""
+
+HEAR_SOURCES = [
+    "Inbound",
+    "Organic - Search",
+    "Organic - Social",
+    "Organic - AI",
+    "Paid - Search",
+    "Paid - Social",
+    "Paid - Display",
+    "Referral - General",
+    "Referral - WOM",
+    "Sales",
+    "Tradeshow",
+    "Unknown"
+]
+
+JSON_SCHEMA = {
+        "type": "object",
+        "additionalProperties": False,
+        "required": [
+            "hear_source",
+            "hear_source_detail"
+        ],
+        "properties": {
+            "hear_source": {
+                "type": "string",
+                "enum": HEAR_SOURCES,
+                "description": "Top-level classification of how the user heard about Telnyx."
+            },
+            "hear_source_detail": {
+                "type": "string",
+                "description": "Specific medium/channel (e.g., 'Google', 'Reddit', 'YouTube', 'Comparison', 'Specific Person Mentioned'). Use empty string if unknown."
+            }
+        }
+    }
+
+JSON_TYPES = {"object": dict, "string": str}
+
+
+def validation_error(value, schema=JSON_SCHEMA, path="$"):
+    """Return a description of the first schema violation, or None if value is valid.
+
+    Covers the subset of JSON Schema that JSON_SCHEMA uses: type, required,
+    properties, additionalProperties and enum.
+    """
+    expected_type = JSON_TYPES.get(schema.get("type"))
+    if expected_type and not isinstance(value, expected_type):
+        return f"{path}: expected {schema['type']}, got {type(value).__name__}"
+
+    if "enum" in schema and value not in schema["enum"]:
+        return f"{path}: {value!r} is not one of the allowed values"
+
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for key in schema.get("required", []):
+            if key not in value:
+                return f"{path}: missing required property {key!r}"
+        for key, item in value.items():
+            if key in properties:
+                error = validation_error(item, properties[key], f"{path}.{key}")
+                if error:
+                    return error
+            elif schema.get("additionalProperties") is False:
+                return f"{path}: unexpected property {key!r}"
+    return None
@@ -0,0 +1,354 @@
+"""Streaming CSV-to-JSONL sharding shared by the 1a/1b conversion scripts.
+
+Rows are read lazily from the export (CSV, gzip CSV or Parquet) and every
+request line is written to its shard as soon as it is packed, so memory
+stays bounded no matter how large the lead export is.
+"""
+import copy
+import csv
+import gzip
+import itertools
+import json
+import resource
+import sys
+import time
+
+import rules
+
+# Rows handed to the token estimator per batched call
+ESTIMATE_CHUNK_SIZE = 2048
+
+ID_COLUMN = "id"
+INPUT_COLUMN = "how_hear"
+
+
+# Placeholders used to build a serialization template from one request entry
+ID_PLACEHOLDER = "\x00custom_id\x00"
+INPUT_PLACEHOLDER = "\x00input\x00"
+
+
+def open_csv(input_path):
+    opener = gzip.open if input_path.endswith(".gz") else open
+    return opener(input_path, "rt", newline='', encoding='utf-8')
+
+
+def iter_csv_rows(input_path, columns=None):
+    with open_csv(input_path) as csvfile:
+        if not columns:
+            yield from csv.DictReader(csvfile)
+            return
+        # Build two-key rows straight from csv.reader instead of a dict of every CRM column
+        reader = csv.reader(csvfile)
+        header = next(reader, [])
+        positions = [header.index(column) for column in columns]
+        for values in reader:
+            # Blank lines are skipped, as csv.DictReader does
+            if not values:
+                continue
+            yield {
+                column: values[position] if position < len(values) else None
+                for column, position in zip(columns, positions)
+            }
+
+
+def open_parquet(input_path):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet input needs pyarrow: pip install pyarrow")
+    return pq.ParquetFile(input_path)
+
+
+def iter_parquet_rows(input_path, columns=None):
+    for record_batch in open_parquet(input_path).iter_batches(columns=columns):
+        for row in record_batch.to_pylist():
+            # custom_id and input must be strings in the request, whatever the column type
+            yield {key: None if value is None else str(value) for key, value in row.items()}
+
+
+def iter_rows(input_path, start_row=0, end_row=None, columns=None):
+    """Yield rows one at a time, skipping to start_row instead of slicing.
+
+    .parquet files are read with pyarrow and .gz files as gzip CSV; anything
+    else is plain CSV. With columns, only those columns are read. Rows with
+    an empty id are skipped: they cannot become a request or be merged back.
+    """
+    if input_path.endswith(".parquet"):
+        rows = iter_parquet_rows(input_path, columns)
+    else:
+        rows = iter_csv_rows(input_path, columns)
+    rows = (row for row in rows if ID_COLUMN not in row or row[ID_COLUMN])
+    yield from itertools.islice(rows, start_row, end_row)
+
+
+def read_header(input_path):
+    """Column names of an export, read the same way as iter_rows reads its rows."""
+    if input_path.endswith(".parquet"):
+        return open_parquet(input_path).schema_arrow.names
+    with open_csv(input_path) as csvfile:
+        return next(csv.reader(csvfile), [])
+
+
+def iter_chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def normalize_input(text):
+    """Case-fold and collapse whitespace so trivially different answers share one request."""
+    if text is None:
+        return ""
+    return " ".join(str(text).split()).casefold()
+
+
+def new_stats():
+    return {
+        "rows_read": 0,
+        "already_classified": 0,
+        "fast_path": 0,
+        "timings": {"read": 0.0, "tokenize": 0.0, "serialize": 0.0, "write": 0.0},
+    }
+
+
+def count_rows(rows, stats):
+    """Count the rows read and the time spent reading them."""
+    rows = iter(rows)
+    timings = stats["timings"]
+    while True:
+        started = time.perf_counter()
+        row = next(rows, None)
+        timings["read"] += time.perf_counter() - started
+        if row is None:
+            return
+        stats["rows_read"] += 1
+        yield row
+
+
+def skip_classified(rows, results_store, prompt_version, stats, chunk_size=ESTIMATE_CHUNK_SIZE):
+    """Yield only rows that are new or whose answer changed since they were last classified."""
+    for chunk in iter_chunks(rows, chunk_size):
+        known = results_store.classified_ids(chunk, prompt_version)
+        stats["already_classified"] += len(known)
+        for row in chunk:
+            if row[ID_COLUMN] not in known:
+                yield row
+
+
+def split_fast_path(rows, fast_path_path, stats):
+    """Classify unambiguous answers locally and yield only the rows that need the batch.
+
+    Local classifications are written in 4_get_batch.py's record format so
+    they can be merged with batch results unchanged.
+    """
+    with open(fast_path_path, 'w', newline='', encoding='utf-8') as fastfile:
+        writer = csv.DictWriter(fastfile, fieldnames=rules.FAST_PATH_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            classification = rules.classify(row[INPUT_COLUMN])
+            if classification is None:
+                yield row
+            else:
+                writer.writerow(rules.fast_path_record(row[ID_COLUMN], classification))
+                stats["fast_path"] += 1
+
+
+def dedupe_rows(rows, dedup_map_path, stats):
+    """Yield only the first row for each normalized input.
+
+    Every row's (id, canonical_id) pair is streamed to dedup_map_path so
+    4_get_batch.py can fan the canonical classification back out.
+    """
+    canonical_ids = {}
+    with open(dedup_map_path, 'w', newline='', encoding='utf-8') as mapfile:
+        writer = csv.writer(mapfile)
+        writer.writerow(["id", "canonical_id"])
+        for row in rows:
+            key = normalize_input(row[INPUT_COLUMN])
+            canonical_id = canonical_ids.setdefault(key, row[ID_COLUMN])
+            writer.writerow([row[ID_COLUMN], canonical_id])
+            if canonical_id == row[ID_COLUMN]:
+                yield row
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def make_line_serializer(sample_entry):
+    """Return a fast serializer for request entries shaped like sample_entry.
+
+    Every request from create_json_entry is identical apart from custom_id
+    and body.input, and the constant part (the hardcoded PROMPT and JSON
+    schema in 1b) dominates each line. It is serialized once into a
+    template, so each line only encodes its two varying strings. The output
+    is byte-identical to json.dumps(entry, ensure_ascii=False).
+    """
+    template = copy.deepcopy(sample_entry)
+    template["custom_id"] = ID_PLACEHOLDER
+    template["body"]["input"] = INPUT_PLACEHOLDER
+    text = json.dumps(template, ensure_ascii=False)
+
+    prefix, rest = text.split(json.dumps(ID_PLACEHOLDER), 1)
+    middle, suffix = rest.split(json.dumps(INPUT_PLACEHOLDER), 1)
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+
+    def serialize(json_entry):
+        return f"{prefix}{encode(json_entry['custom_id'])}{middle}{encode(json_entry['body']['input'])}{suffix}\n"
+
+    return serialize
+
+
+def iter_estimated_entries(rows, create_json_entry, estimate_request_tokens_batch,
+                           chunk_size=ESTIMATE_CHUNK_SIZE, timings=None):
+    """Yield (json_entry, req_tokens), estimating a whole chunk of rows per call."""
+    timings = timings if timings is not None else new_stats()["timings"]
+    for chunk in iter_chunks(rows, chunk_size):
+        json_entries = [create_json_entry(row) for row in chunk]
+        started = time.perf_counter()
+        estimates = estimate_request_tokens_batch(json_entries)
+        timings["tokenize"] += time.perf_counter() - started
+        yield from zip(json_entries, estimates)
+
+
+def shard_rows(rows, create_json_entry, estimate_request_tokens_batch, batch_path,
+               max_tokens_per_batch, max_lines_per_batch, max_bytes_per_batch=None,
+               open_shards=1, chunk_size=ESTIMATE_CHUNK_SIZE, timings=None, make_serializer=make_line_serializer):
+    """Greedily pack rows into shards, writing each line as soon as it is placed.
+
+    A shard is full once its estimated tokens, line count or file size
+    (max_bytes_per_batch, the upload limit) would be exceeded. Estimates are
+    computed in chunks but packing still walks the rows one by one, so with
+    open_shards=1 shard boundaries are identical to per-row estimation.
+
+    With open_shards > 1 each line goes to the first open shard it fits in
+    (first-fit), and when none fits the fullest shard is closed. Long lines
+    no longer end a shard that still has room for the short ones that follow,
+    which yields fewer, fuller shards at the cost of keeping several files open.
+
+    make_serializer(sample_entry) returns the line serializer; the default
+    template serializer assumes every entry is shaped like the first one.
+
+    Returns (rows_written, shards) where each shard is a dict with its index,
+    path, line count, byte size and estimated tokens.
+    """
+    timings = timings if timings is not None else new_stats()["timings"]
+    serialize = None
+    opened = []
+    shards = []
+    next_index = 0
+    rows_written = 0
+
+    def fits(shard, req_tokens, line_bytes):
+        # An empty shard takes any line, so a single oversized request never blocks
+        return not shard["lines"] or (
+            shard["estimated_tokens"] + req_tokens <= max_tokens_per_batch
+            and shard["lines"] < max_lines_per_batch
+            and (max_bytes_per_batch is None or shard["bytes"] + line_bytes <= max_bytes_per_batch)
+        )
+
+    def fill(shard):
+        # Share of the tightest limit already used
+        used = [shard["estimated_tokens"] / max_tokens_per_batch, shard["lines"] / max_lines_per_batch]
+        if max_bytes_per_batch:
+            used.append(shard["bytes"] / max_bytes_per_batch)
+        return max(used)
+
+    def close_shard(shard):
+        opened.remove(shard)
+        shard.pop("file").close()
+        shards.append(shard)
+
+    entries = iter_estimated_entries(rows, create_json_entry, estimate_request_tokens_batch, chunk_size, timings)
+    try:
+        for json_entry, req_tokens in entries:
+            started = time.perf_counter()
+            if serialize is None:
+                serialize = make_serializer(json_entry)
+            # Serialized once: the same bytes are measured and written
+            line = serialize(json_entry).encode('utf-8')
+            serialized = time.perf_counter()
+            timings["serialize"] += serialized - started
+
+            shard = next((shard for shard in opened if fits(shard, req_tokens, len(line))), None)
+            if shard is None:
+                # If adding this item would exceed token/line/byte limits, flush the fullest batch first
+                if len(opened) >= open_shards:
+                    close_shard(max(opened, key=fill))
+                path = batch_path(next_index)
+                shard = {"index": next_index, "path": path, "lines": 0, "bytes": 0, "estimated_tokens": 0,
+                         "file": open(path, 'wb')}
+                opened.append(shard)
+                next_index += 1
+
+            shard["file"].write(line)
+            timings["write"] += time.perf_counter() - serialized
+            shard["lines"] += 1
+            shard["estimated_tokens"] += req_tokens
+            shard["bytes"] += len(line)
+            rows_written += 1
+
+            # Edge case: single request larger than budget; keep it alone to avoid blocking
+            if shard["lines"] == 1 and req_tokens > max_tokens_per_batch:
+                close_shard(shard)
+    finally:
+        for shard in list(opened):
+            close_shard(shard)
+
+    shards.sort(key=lambda shard: shard["index"])
+    return rows_written, shards
+
+
+def shard_csv(input_csv, create_json_entry, estimate_request_tokens_batch, batch_path,
+              max_tokens_per_batch, max_lines_per_batch, start_row=0, end_row=None,
+              dedup_map_path=None, fast_path_path=None, results_store=None, prompt_version=None,
+              max_bytes_per_batch=None, open_shards=1, stats=None):
+    """Shard an export end to end; per-stage counts and timings are filled into stats."""
+    started = time.perf_counter()
+    stats = stats if stats is not None else new_stats()
+    rows = count_rows(iter_rows(input_csv, start_row, end_row, columns=[ID_COLUMN, INPUT_COLUMN]), stats)
+    if results_store is not None:
+        rows = skip_classified(rows, results_store, prompt_version, stats)
+    if fast_path_path:
+        rows = split_fast_path(rows, fast_path_path, stats)
+    if dedup_map_path:
+        rows = dedupe_rows(rows, dedup_map_path, stats)
+
+    rows_written, shards = shard_rows(
+        rows,
+        create_json_entry,
+        estimate_request_tokens_batch,
+        batch_path,
+        max_tokens_per_batch,
+        max_lines_per_batch,
+        max_bytes_per_batch=max_bytes_per_batch,
+        open_shards=open_shards,
+        timings=stats["timings"],
+    )
+    elapsed = time.perf_counter() - started
+    rows_read = stats["rows_read"]
+    rows_per_sec = rows_read / elapsed if elapsed > 0 else 0.0
+    shard_mb = sum(shard["bytes"] for shard in shards) / (1024 * 1024)
+
+    print(f"Wrote {rows_written:,} rows into {len(shards)} shard(s) in {elapsed:.2f}s")
+    print(f"Shard size: {shard_mb:,.1f} MB total, {shard_mb / elapsed if elapsed > 0 else 0.0:,.1f} MB/sec written")
+    if results_store is not None:
+        print(f"Skipped {stats['already_classified']:,} of {rows_read:,} rows already classified")
+    if fast_path_path:
+        fast_share = stats["fast_path"] / rows_read if rows_read else 0.0
+        print(f"Classified {stats['fast_path']:,} of {rows_read:,} rows locally ({fast_share:.1%})")
+        print(f"Fast-path results saved to: {fast_path_path}")
+    if dedup_map_path:
+        remaining = rows_read - stats["already_classified"] - stats["fast_path"]
+        print(f"Deduplicated {remaining:,} rows into {rows_written:,} unique inputs")
+        print(f"Dedup map saved to: {dedup_map_path}")
+    print(f"Throughput: {rows_per_sec:,.0f} rows/sec")
+    timings = stats["timings"]
+    print(f"Timings: read {timings['read']:.2f}s, tokenize {timings['tokenize']:.2f}s, "
+          f"serialize {timings['serialize']:.2f}s, write {timings['write']:.2f}s")
+    print(f"Peak RSS: {peak_rss_mb():.1f} MB")
+    return rows_written, shards
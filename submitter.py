@@ -0,0 +1,117 @@
+"""Concurrent upload and batch creation for every shard in a job manifest.
+
+Shards are uploaded and turned into batches in parallel with AsyncOpenAI,
+limited by a concurrency cap and by the enqueued-token budget still free
+after the job's in-flight batches. The client honours OPENAI_BASE_URL, so
+the whole flow can be pointed at a local mock server.
+"""
+import asyncio
+import os
+import time
+
+import openai
+from dotenv import load_dotenv
+
+import instrumentation
+import manifest
+
+ENDPOINT = "/v1/responses"
+COMPLETION_WINDOW = "24h"
+MAX_CONCURRENT_SUBMISSIONS = 4
+MAX_SUBMIT_ATTEMPTS = 5  # after this many failed uploads/creates a shard is marked failed instead of retried
+ENQUEUED_TOKEN_BUDGET = 1500000  # org enqueued-token limit, from https://platform.openai.com/settings/organization/limits
+
+
+def make_async_client():
+    load_dotenv()
+    return openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+
+def select_within_budget(job_manifest, token_budget, reserved=None):
+    """Pick pending shards, in order, whose estimates fit in the budget left per model.
+
+    reserved is {model: tokens} in flight for other jobs, which count against
+    the same org-wide limit.
+    """
+    reserved = reserved or {}
+    remaining = {}
+    selected = []
+    for shard in job_manifest["shards"]:
+        if not manifest.is_pending(shard):
+            continue
+        model = shard.get("model")
+        if model not in remaining:
+            remaining[model] = token_budget - reserved.get(model, 0) - manifest.in_flight_tokens(job_manifest, model)
+        # An oversized shard still goes alone once nothing at all is queued for its model, so it cannot block forever
+        queue_empty = remaining[model] == token_budget
+        # Keep submission order stable: stop at the first shard that does not fit for its model
+        if shard["estimated_tokens"] > remaining[model] and not queue_empty:
+            remaining[model] = -1
+            continue
+        remaining[model] -= shard["estimated_tokens"]
+        selected.append(shard)
+    return selected
+
+
+async def submit_shard(client, shard, semaphore, job, description):
+    async with semaphore:
+        try:
+            with instrumentation.timed("upload", job=job, shard=shard["index"]):
+                with open(shard["path"], "rb") as f:
+                    batch_input_file = await client.files.create(file=f, purpose="batch")
+            shard["input_file_id"] = batch_input_file.id
+
+            batch = await client.batches.create(
+                input_file_id=batch_input_file.id,
+                endpoint=ENDPOINT,
+                completion_window=COMPLETION_WINDOW,
+                metadata={"description": description, "job": job, "shard": str(shard["index"])},
+            )
+        except openai.OpenAIError as e:
+            shard["submit_attempts"] = shard.get("submit_attempts", 0) + 1
+            shard["error"] = str(e)
+            if shard["submit_attempts"] >= MAX_SUBMIT_ATTEMPTS:
+                # Most likely a permanent error such as a 400 on upload, so stop resubmitting it
+                shard["status"] = "failed"
+                print(f"Shard {shard['index']} failed to submit {shard['submit_attempts']} times, giving up: {e}")
+            else:
+                shard["status"] = "submit_failed"
+                print(f"Shard {shard['index']} failed to submit: {e}")
+            return shard
+
+    shard["batch_id"] = batch.id
+    shard["status"] = batch.status
+    shard["submitted_at"] = int(time.time())
+    shard.pop("error", None)
+    print(f"Shard {shard['index']} -> batch {batch.id} ({shard['estimated_tokens']:,} est. tokens)")
+    return shard
+
+
+async def submit_shards(client, job_manifest, shards, manifest_path, concurrency, description):
+    semaphore = asyncio.Semaphore(concurrency)
+    base = manifest.snapshot(job_manifest)
+    tasks = [
+        asyncio.create_task(submit_shard(client, shard, semaphore, job_manifest["job"], description))
+        for shard in shards
+    ]
+    # Persist after every submission so a crash never loses a created batch id
+    for task in asyncio.as_completed(tasks):
+        await task
+        manifest.save_changes(job_manifest, base, manifest_path)
+        base = manifest.snapshot(job_manifest)
+
+
+async def submit_all(manifest_path=manifest.MANIFEST_JSON, concurrency=MAX_CONCURRENT_SUBMISSIONS,
+                     token_budget=ENQUEUED_TOKEN_BUDGET, description="", client=None, reserved=None):
+    """Submit every pending shard that fits in the budget; returns the submitted shards."""
+    client = client or make_async_client()
+    job_manifest = manifest.load(manifest_path)
+    shards = select_within_budget(job_manifest, token_budget, reserved)
+
+    skipped = sum(1 for shard in job_manifest["shards"] if manifest.is_pending(shard)) - len(shards)
+    print(f"Submitting {len(shards)} shard(s) for {job_manifest['job']} "
+          f"({skipped} left pending by the {token_budget:,} token budget"
+          + (f", {sum(reserved.values()):,} of it used by other jobs)" if reserved else ")"))
+
+    await submit_shards(client, job_manifest, shards, manifest_path, concurrency, description)
+    return [shard for shard in shards if shard.get("batch_id")]
@@ -0,0 +1,103 @@
+"""Persistent token-count cache shared by the 1a/1b conversion scripts.
+
+"How did you hear about us" answers repeat constantly, so token counts are
+stored in a small SQLite table keyed by a hash of the encoder name and the
+exact input text, with an in-process LRU in front of it. Re-runs and daily
+incremental exports then skip nearly all tokenization.
+"""
+import hashlib
+import os
+import sqlite3
+from collections import OrderedDict
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "token_cache.sqlite")
+LRU_SIZE = 100_000
+SQLITE_MAX_PARAMS = 500  # keep IN (...) lookups well under SQLite's variable limit
+
+
+def cache_key(encoder_name, text):
+    # Keyed on the exact text: case or whitespace changes can change the token count
+    return hashlib.sha1(f"{encoder_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class TokenCache:
+    def __init__(self, enc, path=DEFAULT_CACHE_PATH, lru_size=LRU_SIZE):
+        self.enc = enc
+        self.lru_size = lru_size
+        self.lru = OrderedDict()
+        self.lru_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS token_counts (key TEXT PRIMARY KEY, tokens INTEGER NOT NULL)"
+        )
+
+    def _remember(self, key, tokens):
+        self.lru[key] = tokens
+        self.lru.move_to_end(key)
+        if len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def _lookup_disk(self, keys):
+        found = {}
+        for start in range(0, len(keys), SQLITE_MAX_PARAMS):
+            chunk = keys[start:start + SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, tokens FROM token_counts WHERE key IN ({placeholders})", chunk
+            )
+            found.update(rows)
+        return found
+
+    def count_batch(self, texts, workers=1):
+        """Return token counts for texts, encoding only those never seen before."""
+        texts = ["" if text is None else str(text) for text in texts]
+        keys = [cache_key(self.enc.name, text) for text in texts]
+
+        counts = {}
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key in counts or key in pending:
+                # Repeats within the same chunk are resolved once
+                self.lru_hits += 1
+                continue
+            if key in self.lru:
+                self.lru.move_to_end(key)
+                counts[key] = self.lru[key]
+                self.lru_hits += 1
+            else:
+                pending[key] = text
+
+        if pending:
+            for key, tokens in self._lookup_disk(list(pending)).items():
+                counts[key] = tokens
+                self._remember(key, tokens)
+                self.disk_hits += 1
+                del pending[key]
+
+        if pending:
+            missing_keys = list(pending)
+            encoded = self.enc.encode_batch([pending[key] for key in missing_keys], num_threads=workers)
+            new_rows = [(key, len(tokens)) for key, tokens in zip(missing_keys, encoded)]
+            self.conn.executemany("INSERT OR IGNORE INTO token_counts (key, tokens) VALUES (?, ?)", new_rows)
+            self.conn.commit()
+            for key, tokens in new_rows:
+                counts[key] = tokens
+                self._remember(key, tokens)
+            self.misses += len(new_rows)
+
+        return [counts[key] for key in keys]
+
+    def hit_rate(self):
+        lookups = self.lru_hits + self.disk_hits + self.misses
+        return (self.lru_hits + self.disk_hits) / lookups if lookups else 0.0
+
+    def print_stats(self):
+        print(
+            f"Token cache: {self.lru_hits:,} memory hits, {self.disk_hits:,} disk hits, "
+            f"{self.misses:,} encoded ({self.hit_rate():.1%} hit rate)"
+        )
+
+    def close(self):
+        self.conn.close()